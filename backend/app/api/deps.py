@@ -1,15 +1,16 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 from app.core.config import settings
-from app.db.database import get_db
+from app.core.user_cache import user_cache
+from app.db.database import SessionLocal
 from app.db.models.user import User
 
 # Configuration pour dire à Swagger où est la route de login
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Identifiants invalides",
@@ -24,7 +25,15 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    # Les tableaux de bord qui interrogent l'historique en boucle ne repassent pas par la base
+    user = user_cache.get(username)
+    if user is not None:
+        return user
+
+    # Session propre à la vérification : la connexion est rendue au pool avant le traitement de la requête
+    async with SessionLocal() as db:
+        user = (await db.execute(select(User).where(User.username == username))).scalar_one_or_none()
     if user is None:
         raise credentials_exception
+    user_cache.put(user)
     return user
\ No newline at end of file
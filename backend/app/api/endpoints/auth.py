@@ -1,41 +1,54 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.database import get_db
 from app.db.models.user import User
 from app.schemas.user import UserCreate, UserResponse
 from app.schemas.token import Token
-from app.core.security import verify_password, get_password_hash, create_access_token
+from app.core.security import aget_password_hash, averify_password, create_access_token, needs_rehash, track_login
 from app.core.config import settings
 
 router = APIRouter()
 
 @router.post("/signup", response_model=UserResponse)
-def create_user(user_in: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
     # Vérifier si l'utilisateur existe déjà
-    user = db.query(User).filter((User.email == user_in.email) | (User.username == user_in.username)).first()
+    user = (await db.execute(
+        select(User).where((User.email == user_in.email) | (User.username == user_in.username))
+    )).scalars().first()
     if user:
         raise HTTPException(status_code=400, detail="Email ou nom d'utilisateur déjà utilisé")
     
-    # Hasher le mot de passe et sauvegarder
-    hashed_password = get_password_hash(user_in.password)
+    # Hasher le mot de passe (pool bcrypt dédié) et sauvegarder
+    hashed_password = await aget_password_hash(user_in.password)
     new_user = User(username=user_in.username, email=user_in.email, hashed_password=hashed_password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 @router.post("/login", response_model=Token)
-def login_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    # Vérifier l'utilisateur
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
-        raise HTTPException(status_code=400, detail="Nom d'utilisateur ou mot de passe incorrect")
-    
-    # Créer le token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+async def login_access_token(db: AsyncSession = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+    with track_login() as login:
+        # Vérifier l'utilisateur
+        user = (await db.execute(select(User).where(User.username == form_data.username))).scalar_one_or_none()
+        # Fin de la transaction de lecture : la connexion retourne au pool pendant bcrypt
+        await db.commit()
+        if not user or not await averify_password(form_data.password, user.hashed_password):
+            login["outcome"] = "failure"
+            raise HTTPException(status_code=400, detail="Nom d'utilisateur ou mot de passe incorrect")
+
+        # BCRYPT_ROUNDS a changé depuis l'inscription : le mot de passe en clair est disponible, on réhache
+        if needs_rehash(user.hashed_password):
+            user.hashed_password = await aget_password_hash(form_data.password)
+            await db.commit()
+
+        # Créer le token
+        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        access_token = create_access_token(
+            data={"sub": user.username}, expires_delta=access_token_expires
+        )
+        login["outcome"] = "success"
+        return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
@@ -1,24 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.api import deps
 from app.db.database import get_db
+from app.db.search import search_supported
 from app.db.models.user import User
 from app.services.query_service import query_service
-from app.schemas.query import QueryBase, QueryResponse
+from app.schemas.query import QueryHistoryPage, QueryRequest, QueryResponse, QuerySearchPage
 
 router = APIRouter()
 
 @router.post("/query", response_model=QueryResponse)
-def post_medical_query(
-    query_in: QueryBase,
-    db: Session = Depends(get_db),
+async def post_medical_query(
+    query_in: QueryRequest,
     current_user: User = Depends(deps.get_current_user)
 ):
+    # Pas de session injectée : le service n'en ouvre une que pour enregistrer la réponse
     try:
-        return query_service.create_medical_query(
-            db=db, 
+        return await query_service.create_medical_query(
             user=current_user, 
-            query_text=query_in.query_text
+            query_text=query_in.query_text,
+            service=query_in.service
         )
     except Exception as e:
         raise HTTPException(
@@ -26,10 +30,65 @@ def post_medical_query(
             detail=f"Erreur RAG : {str(e)}"
         )
 
-@router.get("/history", response_model=list[QueryResponse])
-def get_history(
-    db: Session = Depends(get_db),
+def format_sse(event: str, payload) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, default=str, ensure_ascii=False)}\n\n"
+
+@router.post("/query/stream")
+async def stream_medical_query(
+    query_in: QueryRequest,
+    current_user: User = Depends(deps.get_current_user)
+):
+    # Server-Sent Events : "sources", puis un "token" par fragment généré, puis "done" une fois persisté
+    async def event_stream():
+        try:
+            async for event, payload in query_service.stream_medical_query(
+                user=current_user,
+                query_text=query_in.query_text,
+                service=query_in.service
+            ):
+                yield format_sse(event, payload)
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Erreur RAG : {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/history", response_model=QueryHistoryPage)
+async def get_history(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(deps.get_current_user)
+):
+    # Résumés uniquement ; la réponse complète se lit via /history/{query_id}
+    try:
+        return await query_service.get_user_query_history(db, current_user.id, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/history/search", response_model=QuerySearchPage)
+async def search_history(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(deps.get_current_user)
+):
+    # Déclarée avant /history/{query_id} pour ne pas être capturée par le paramètre de chemin
+    if not search_supported(db.get_bind()):
+        raise HTTPException(status_code=501, detail="Recherche plein texte disponible uniquement avec PostgreSQL")
+    return await query_service.search_user_queries(db, current_user.id, q, limit=limit, offset=offset)
+
+@router.get("/history/{query_id}", response_model=QueryResponse)
+async def get_history_item(
+    query_id: int,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(deps.get_current_user)
 ):
-    # All logic is hidden in the service
-    return query_service.get_user_query_history(db, current_user.id)
\ No newline at end of file
+    query = await query_service.get_user_query(db, current_user.id, query_id)
+    if query is None:
+        raise HTTPException(status_code=404, detail="Requête introuvable")
+    return query
\ No newline at end of file
@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.core.resources import resources
+
+router = APIRouter()
+
+@router.get("/live")
+def liveness():
+    # Le processus répond : les modèles peuvent encore être en cours de chargement
+    return {"status": "alive"}
+
+@router.get("/ready")
+def readiness():
+    # 503 tant que les modèles ne sont pas chargés : le load balancer n'envoie pas encore de trafic
+    status = resources.status()
+    ready = bool(status) and all(state == "ready" for state in status.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "loading", "resources": status}
+    )
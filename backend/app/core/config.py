@@ -2,27 +2,70 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "CliniQ API"
+    # Chargement des modèles en arrière-plan au démarrage (sinon au premier appel)
+    WARMUP_ON_STARTUP: bool = True
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Cache des utilisateurs authentifiés (0 entrée = désactivé)
+    USER_CACHE_TTL: float = 60.0
+    USER_CACHE_MAX_SIZE: int = 1024
+    # Facteur de coût bcrypt (2^rounds itérations) ; un changement réhache les mots de passe à la connexion
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
     DATABASE_URL: str
+    # Pool du moteur asyncpg (par worker uvicorn)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
     COHERE_API_KEY: str 
     GOOGLE_API_KEY: str
     GROQ_API_KEY: str
    
     MLFLOW_TRACKING_URI: str = "http://cliniq_mlflow:5000"
+    TELEMETRY_QUEUE_SIZE: int = 10000
+    # Enregistrements traités par réveil du worker (chacun reste un run MLflow distinct)
+    TELEMETRY_BATCH_SIZE: int = 50
+    TELEMETRY_FLUSH_INTERVAL: float = 5.0
     
     EXPANSION_MODEL: str = "gemini-2.5-flash-lite"
     EXPANSION_TEMP: float = 0.2
+    EXPANSION_TIMEOUT: float = 2.0
+    QUERY_EXPANSION: bool = True
+    SPECULATIVE_RETRIEVAL: bool = True
     
     EMBEDDING_MODEL: str = "BAAI/bge-m3"
     RETRIEVAL_K: int = 5
+    CHROMA_PERSIST_DIR: str = "/app/chroma_db"
+    HYBRID_RETRIEVAL: bool = False
+    # Déduit le service (PÉDIATRIE, DENTAIRE...) de la question et filtre Chroma dessus quand il est non ambigu
+    SERVICE_AUTO_DETECT: bool = False
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "/app/data/cache/embeddings.sqlite"
+    CONVERSION_CACHE_DIR: str = "/app/data/cache/docling"
+    # "torch" (sentence-transformers), "onnx" ou "onnx-int8" (export dans EMBEDDING_ONNX_PATH)
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_PATH: str = "/app/data/models/bge-m3-onnx"
+    # Vide -> modèle chargé dans le processus ; sinon URL du sidecar app.rag.embedding_server
+    EMBEDDING_SERVER_URL: str = ""
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_WAIT_MS: float = 5.0
     
+    # "rerank-*" -> API Cohere ; tout autre nom -> cross-encoder local (ex: "BAAI/bge-reranker-v2-m3")
     RERANK_MODEL: str = "rerank-multilingual-v3.0"
     RERANK_TOP_N: int = 3
     
     GENERATOR_MODEL: str = "gemini-flash-latest"
     GENERATOR_TEMP: float = 0.0
+    # Budget (tokens estimés) du contexte envoyé au générateur
+    CONTEXT_TOKEN_BUDGET: int = 3000
+
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_TTL: int = 3600
+    ANSWER_CACHE_MAX_SIZE: int = 512
+    ANSWER_CACHE_SIMILARITY: float = 0.95
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,92 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+class TokenBucket:
+    """Classic token bucket: `capacity` units, refilled continuously at `rate` units per second."""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self.level -= amount
+
+class RateLimiter:
+    """Async limiter enforcing a provider's requests-per-minute and tokens-per-minute quotas."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm, rpm / 60)
+        self.tokens = TokenBucket(tpm, tpm / 60)
+        self._paused_until = 0.0
+        self._lock = None
+
+    async def acquire(self, tokens: int = 1):
+        # Le verrou sert les appelants dans l'ordre d'arrivée : pas de famine des gros prompts
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        tokens = min(tokens, self.tokens.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self._paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(tokens, now)
+                )
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        # Après un 429, plus aucun appel ne part avant la fin du délai imposé par le fournisseur
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or "429" in str(error)
+
+def retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+async def call_with_backoff(
+    call: Callable[[], Awaitable[T]],
+    limiter: Optional[RateLimiter] = None,
+    tokens: int = 1,
+    max_retries: int = 5,
+    base_delay: float = 2.0,
+    max_delay: float = 60.0
+) -> T:
+    """Runs `call` behind the limiter, retrying 429s with Retry-After or jittered exponential backoff."""
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            await limiter.acquire(tokens)
+        try:
+            return await call()
+        except Exception as e:
+            if not is_rate_limited(e) or attempt == max_retries:
+                raise
+            delay = retry_after(e) or min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"⏳ Rate limit atteint, nouvel essai dans {delay:.1f}s (essai {attempt + 1}/{max_retries})...")
+            if limiter is not None:
+                limiter.pause(delay)
+            await asyncio.sleep(delay)
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+class ResourceRegistry:
+    """Process-wide registry of heavy singletons (models, clients), each built at most once per worker."""
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._errors: Dict[str, str] = {}
+        self._load_times: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._registry_lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        with self._registry_lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+
+    def provide(self, name: str, instance: Any):
+        """Installs a ready-made instance (tests, benchmarks) instead of calling the factory."""
+        with self._registry_lock:
+            self._locks.setdefault(name, threading.Lock())
+            self._instances[name] = instance
+            self._errors.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        if name in self._instances:
+            return self._instances[name]
+        if name not in self._factories:
+            raise KeyError(f"Ressource inconnue : {name}")
+
+        # Un verrou par ressource : le pipeline peut demander les embeddings pendant sa propre construction
+        with self._locks[name]:
+            if name not in self._instances:
+                start = time.perf_counter()
+                try:
+                    self._instances[name] = self._factories[name]()
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    raise
+                self._errors.pop(name, None)
+                self._load_times[name] = time.perf_counter() - start
+        return self._instances[name]
+
+    async def aget(self, name: str) -> Any:
+        # Le chargement éventuel (poids du modèle, Chroma) se fait hors de la boucle d'événements
+        if name in self._instances:
+            return self._instances[name]
+        return await asyncio.to_thread(self.get, name)
+
+    async def warm_up(self, names: Optional[Iterable[str]] = None):
+        for name in names or list(self._factories):
+            try:
+                await self.aget(name)
+                print(f"🔥 [Warm-up] {name} prêt en {self._load_times.get(name, 0.0):.1f}s.")
+            except Exception as e:
+                print(f"❌ [Warm-up] Échec du chargement de {name} : {e}")
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def status(self) -> Dict[str, str]:
+        names = set(self._factories) | set(self._instances)
+        return {
+            name: "ready" if name in self._instances
+            else f"error: {self._errors[name]}" if name in self._errors
+            else "loading" if self._locks[name].locked()
+            else "pending"
+            for name in sorted(names)
+        }
+
+resources = ResourceRegistry()
@@ -1,18 +1,57 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import jwt
 import bcrypt
+from prometheus_client import Histogram
 from app.core.config import settings
 
+AUTH_LOGIN_LATENCY = Histogram(
+    'auth_login_latency_seconds', 'Durée de /auth/login, vérification bcrypt comprise', ['outcome'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0)
+)
+
+# Pool dédié et borné : les hachages d'un pic de connexions font la queue ici,
+# sans occuper le threadpool partagé avec le reste de l'API. bcrypt libère le GIL.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     # bcrypt nécessite des bytes, donc on encode les chaînes
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def get_password_hash(password: str) -> str:
     # Génère le sel et le hash, puis le décode en string pour la BDD
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
+def needs_rehash(hashed_password: str) -> bool:
+    # Format "$2b$<coût>$<sel+hash>" : le coût est relu dans le hash stocké
+    try:
+        return int(hashed_password.split('$')[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+
+async def aget_password_hash(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, get_password_hash, password)
+
+@contextmanager
+def track_login():
+    """Observes the login duration; the yielded dict's "outcome" is set by the handler."""
+    labels = {"outcome": "error"}
+    start = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        AUTH_LOGIN_LATENCY.labels(**labels).observe(time.perf_counter() - start)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
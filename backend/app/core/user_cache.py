@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+from prometheus_client import Counter
+from sqlalchemy import event, inspect
+from app.core.config import settings
+from app.db.models.user import User
+
+AUTH_USER_CACHE = Counter(
+    'auth_user_cache_requests_total', 'Résolutions du sujet JWT servies par le cache ou par la base', ['outcome']
+)
+
+class UserCache:
+    """Per-worker TTL/LRU cache of resolved users, keyed by the JWT subject (username)."""
+
+    def __init__(self, ttl: float = settings.USER_CACHE_TTL, max_size: int = settings.USER_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        # username -> (utilisateur détaché de sa session, date d'insertion)
+        self._entries = OrderedDict()
+
+    def get(self, username: str) -> Optional[User]:
+        entry = self._entries.get(username)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            self._entries.pop(username, None)
+            AUTH_USER_CACHE.labels(outcome="miss").inc()
+            return None
+        self._entries.move_to_end(username)
+        AUTH_USER_CACHE.labels(outcome="hit").inc()
+        return entry[0]
+
+    def put(self, user: User):
+        if self.max_size <= 0:
+            return
+        self._entries[user.username] = (user, time.monotonic())
+        self._entries.move_to_end(user.username)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        self._entries.pop(username, None)
+
+    def clear(self):
+        self._entries.clear()
+
+user_cache = UserCache()
+
+# Toute modification ou suppression d'un utilisateur via l'ORM purge son entrée dans ce worker ;
+# les autres workers la voient expirer au plus tard après USER_CACHE_TTL
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.username)
+    # Renommage : l'ancien sujet JWT ne doit plus résoudre vers cet utilisateur
+    for previous in inspect(target).attrs.username.history.deleted:
+        user_cache.invalidate(previous)
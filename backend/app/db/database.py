@@ -1,20 +1,48 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import NullPool
 from app.core.config import settings
+from app.db.metrics import instrument_pool
 
-# Création du moteur de base de données PostgreSQL
-engine = create_engine(settings.DATABASE_URL)
+# Pilotes asynchrones équivalents aux URLs synchrones de DATABASE_URL
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
 
-# Session pour interagir avec la DB
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername)).render_as_string(hide_password=False)
+
+def pool_options(url: str) -> dict:
+    # SQLite (tests, benchmark) garde le pool par défaut de son pilote
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        # Une connexion coupée par Postgres ou un proxy est remplacée au lieu de faire échouer la requête
+        "pool_pre_ping": settings.DB_POOL_PRE_PING
+    }
+
+# Moteur asynchrone (asyncpg) utilisé par l'API
+async_engine = create_async_engine(async_database_url(settings.DATABASE_URL), **pool_options(settings.DATABASE_URL))
+instrument_pool(async_engine.sync_engine)
+
+# Moteur synchrone réservé à la création du schéma au démarrage : aucune connexion Postgres gardée ouverte
+# (SQLite garde le pool par défaut de son pilote). Avec sqlite:///:memory:, les deux moteurs ouvrent
+# chacun leur propre base : les tables créées ici n'existent pas pour async_engine. Les tests qui passent
+# par la base utilisent leur propre moteur aiosqlite, le benchmark une base SQLite fichier.
+engine = create_engine(settings.DATABASE_URL, **({"poolclass": NullPool} if pool_options(settings.DATABASE_URL) else {}))
+
+# expire_on_commit=False : les objets restent lisibles une fois la session fermée
+SessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
 
 # Classe de base pour nos modèles
 Base = declarative_base()
 
-# Dépendance pour injecter la DB dans nos routes FastAPI
-def get_db():
-    db = SessionLocal()
-    try:
+# Dépendance pour injecter la DB dans les routes courtes (auth, historique)
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,58 @@
+import time
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+class PoolMetrics:
+    """Prometheus metrics of a SQLAlchemy connection pool, registered in `registry`."""
+
+    def __init__(self, registry: CollectorRegistry = REGISTRY):
+        # Occupation du pool de connexions Postgres : un pool saturé se voit ici avant les timeouts
+        self.connections = Gauge(
+            'db_pool_connections', 'Connexions du pool SQLAlchemy par état', ['state'], registry=registry
+        )
+        self.checkout_hold = Histogram(
+            'db_pool_checkout_hold_seconds', 'Durée pendant laquelle une connexion reste empruntée au pool',
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0), registry=registry
+        )
+        self.events = Counter(
+            'db_pool_events_total', 'Connexions ouvertes, invalidées (pre-ping) ou fermées par le pool', ['event'],
+            registry=registry
+        )
+
+pool_metrics = PoolMetrics()
+
+def instrument_pool(engine: Engine, metrics: PoolMetrics = pool_metrics):
+    """Exports the pool state of a (sync or async-wrapped) engine to Prometheus."""
+    pool = engine.pool
+    # NullPool / StaticPool (SQLite) n'exposent pas ces compteurs
+    for state, reader in (
+        ("checked_out", "checkedout"),
+        ("idle", "checkedin"),
+        ("overflow", "overflow"),
+        ("size", "size")
+    ):
+        if hasattr(pool, reader):
+            metrics.connections.labels(state=state).set_function(getattr(pool, reader))
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checkout_time"] = time.perf_counter()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        start = connection_record.info.pop("checkout_time", None)
+        if start is not None:
+            metrics.checkout_hold.observe(time.perf_counter() - start)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.events.labels(event="connect").inc()
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.events.labels(event="invalidate").inc()
+
+    @event.listens_for(engine, "close")
+    def on_close(dbapi_connection, connection_record):
+        metrics.events.labels(event="close").inc()
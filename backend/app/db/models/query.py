@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from app.db.database import Base
 
@@ -11,4 +11,9 @@ class Query(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Foreign key to track history per medical professional
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
\ No newline at end of file
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    # Historique paginé par curseur : WHERE user_id = ? ORDER BY created_at DESC servi par l'index
+    __table_args__ = (
+        Index("ix_queries_user_id_created_at", "user_id", "created_at"),
+    )
\ No newline at end of file
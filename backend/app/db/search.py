@@ -0,0 +1,59 @@
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.engine import Engine
+from app.db.models.query import Query
+
+# Recherche plein texte sur l'historique (Postgres uniquement) : colonne tsvector générée
+# et index GIN, créés au démarrage faute de migrations (create_all ne touche pas aux tables existantes).
+SEARCH_CONFIG = "french"
+# La question pèse plus que la réponse dans le classement
+SEARCH_VECTOR_DDL = f"""
+ALTER TABLE queries ADD COLUMN IF NOT EXISTS search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(query_text, '')), 'A') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(response_text, '')), 'B')
+) STORED
+"""
+SEARCH_INDEX_DDL = "CREATE INDEX IF NOT EXISTS ix_queries_search_vector ON queries USING GIN (search_vector)"
+# Surlignage en gras Markdown : les extraits s'affichent tels quels dans Streamlit
+HEADLINE_OPTIONS = "StartSel=**, StopSel=**, MinWords=10, MaxWords=35, MaxFragments=2, FragmentDelimiter=\" … \""
+
+search_vector = literal_column("queries.search_vector")
+
+def search_supported(bind: Engine) -> bool:
+    # tsvector, GIN et ts_headline n'existent que sous Postgres (SQLite des tests et du benchmark : non)
+    return bind.dialect.name == "postgresql"
+
+def ensure_search_index(engine: Engine):
+    if not search_supported(engine):
+        return
+    # La colonne générée réécrit la table une seule fois ; les insertions suivantes la calculent d'elles-mêmes
+    with engine.begin() as conn:
+        conn.execute(text(SEARCH_VECTOR_DDL))
+        conn.execute(text(SEARCH_INDEX_DDL))
+
+def build_search_query(user_id: int, terms: str, limit: int, offset: int = 0):
+    """Ranked hits of one user's history for a web-style query ("bronchiolite -adulte", "\"choc septique\"")."""
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, terms)
+    rank = func.ts_rank_cd(search_vector, tsquery).label("rank")
+    # Classement et pagination d'abord (index GIN + index user_id), extraits ensuite :
+    # ts_headline relit le texte complet et n'est calculé que pour la page renvoyée
+    hits = (
+        select(Query.id, rank)
+        .where(Query.user_id == user_id, search_vector.op("@@")(tsquery))
+        .order_by(rank.desc(), Query.id.desc())
+        .limit(limit + 1)
+        .offset(offset)
+        .subquery()
+    )
+    return (
+        select(
+            Query.id,
+            Query.query_text,
+            Query.created_at,
+            hits.c.rank,
+            func.ts_headline(SEARCH_CONFIG, Query.query_text, tsquery, HEADLINE_OPTIONS).label("query_snippet"),
+            func.ts_headline(SEARCH_CONFIG, Query.response_text, tsquery, HEADLINE_OPTIONS).label("response_snippet")
+        )
+        .join(hits, hits.c.id == Query.id)
+        .order_by(hits.c.rank.desc(), Query.id.desc())
+    )
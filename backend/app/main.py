@@ -1,15 +1,40 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.db.database import engine, Base
+from app.db.database import async_engine, engine, Base
 from app.db.models import user
-from app.api.endpoints import auth, chat 
+from app.db.models.query import Query
+from app.db.search import ensure_search_index
+from app.api.endpoints import auth, chat, health
+from app.core.config import settings
+from app.core.resources import resources
+from app.services.query_service import PIPELINE_RESOURCE
+from app.services.telemetry import mlflow_exporter
 from prometheus_fastapi_instrumentator import Instrumentator
 
 Base.metadata.create_all(bind=engine)
+# create_all ne crée pas les index ajoutés à une table qui existe déjà
+for index in Query.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+ensure_search_index(engine)
 
-app = FastAPI(title="CliniQ API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # BGE-M3, Chroma et clients LLM se chargent en arrière-plan : l'API répond tout de suite
+    # et /health/ready passe à 200 une fois le pipeline prêt
+    warmup = asyncio.create_task(resources.warm_up([PIPELINE_RESOURCE])) if settings.WARMUP_ON_STARTUP else None
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    # Vide la file de télémétrie MLflow avant l'arrêt du worker
+    await asyncio.to_thread(mlflow_exporter.shutdown)
+    await async_engine.dispose()
+
+app = FastAPI(title="CliniQ API", version="1.0.0", lifespan=lifespan)
 
 app.include_router(auth.router, prefix="/auth", tags=["Authentification"])
 app.include_router(chat.router, prefix="/chat", tags=["RAG Assistant"])
+app.include_router(health.router, prefix="/health", tags=["Santé"])
 
 # pour exposer les métriques
 Instrumentator().instrument(app).expose(app)
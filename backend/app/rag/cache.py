@@ -0,0 +1,97 @@
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from app.core.config import settings
+
+# Fichier touché par l'ingestion à chaque reconstruction de la collection Chroma
+INGESTION_STAMP = "ingestion.stamp"
+
+def normalize_question(question: str) -> str:
+    # "Fièvre mal supportée ?" et "fievre  mal supportee" donnent la même clé
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+def mark_collection_rebuilt(persist_dir: str = settings.CHROMA_PERSIST_DIR):
+    """Signals every running API worker that its cached answers are stale."""
+    os.makedirs(persist_dir, exist_ok=True)
+    with open(os.path.join(persist_dir, INGESTION_STAMP), "w") as f:
+        f.write(str(time.time()))
+
+class AnswerCache:
+    """Two-level (exact + semantic) TTL/LRU cache of pipeline answers."""
+
+    def __init__(self):
+        self.ttl = settings.ANSWER_CACHE_TTL
+        self.max_size = settings.ANSWER_CACHE_MAX_SIZE
+        self.similarity_threshold = settings.ANSWER_CACHE_SIMILARITY
+        self.stamp_path = os.path.join(settings.CHROMA_PERSIST_DIR, INGESTION_STAMP)
+
+        # clé normalisée -> (vecteur de la question, résultat, date d'insertion, domaine filtré)
+        self._entries = OrderedDict()
+        self._collection_version = self._read_collection_version()
+
+    def _read_collection_version(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.stamp_path)
+        except OSError:
+            return None
+
+    def _check_collection_version(self):
+        version = self._read_collection_version()
+        if version != self._collection_version:
+            print("♻️ [Cache] Collection Chroma reconstruite : invalidation des réponses en cache.")
+            self.clear()
+            self._collection_version = version
+
+    def _evict_expired(self):
+        now = time.time()
+        expired = [key for key, (_, _, created_at, _) in self._entries.items() if now - created_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    @staticmethod
+    def _key(question: str, scope: Optional[str]) -> str:
+        # Une même question filtrée sur un service n'a pas la même réponse que sans filtre
+        key = normalize_question(question)
+        return f"{scope}|{key}" if scope else key
+
+    def get_exact(self, question: str, scope: Optional[str] = None) -> Optional[dict]:
+        self._check_collection_version()
+        self._evict_expired()
+        key = self._key(question, scope)
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key][1]
+
+    def get_semantic(self, query_vector: List[float], scope: Optional[str] = None) -> Optional[dict]:
+        self._evict_expired()
+        keys = [key for key, entry in self._entries.items() if entry[3] == scope]
+        if not keys:
+            return None
+
+        # Les embeddings BGE-M3 sont normalisés : le produit scalaire est la similarité cosinus
+        matrix = np.array([self._entries[key][0] for key in keys])
+        scores = matrix @ np.asarray(query_vector)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+
+        self._entries.move_to_end(keys[best])
+        return self._entries[keys[best]][1]
+
+    def put(self, question: str, query_vector: List[float], result: dict, scope: Optional[str] = None):
+        key = self._key(question, scope)
+        self._entries[key] = (query_vector, result, time.time(), scope)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
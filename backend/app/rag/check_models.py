@@ -1,6 +1,6 @@
 import os
 import re
-from docling.document_converter import DocumentConverter
+from app.rag.conversion import convert_pdf
 from langchain_text_splitters import MarkdownHeaderTextSplitter
 
 PDF_PATH = "/app/data/raw_pdfs/guide_medical.pdf"
@@ -11,9 +11,8 @@ def test_flattened_chunking():
         return
 
     print("📄 Converting PDF to Markdown...")
-    converter = DocumentConverter()
-    result = converter.convert(PDF_PATH)
-    markdown_content = result.document.export_to_markdown()
+    # Relu depuis le cache de conversion : seul le premier lancement paie le parsing Docling
+    markdown_content, _ = convert_pdf(PDF_PATH)
 
     # Split only on ## because your PDF uses it for every main title
     headers_to_split_on = [("##", "header_title")]
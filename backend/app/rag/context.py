@@ -0,0 +1,86 @@
+import re
+from typing import List, Optional, Tuple
+from langchain_core.documents import Document
+from app.core.config import settings
+from app.rag.lexical import tokenize
+from app.rag.metrics import RAG_CONTEXT_CHUNKS, RAG_CONTEXT_TOKENS, estimate_tokens
+
+# Préfixe injecté à l'ingestion : "DOMAINE: ...\nSUJET: ...\n---\n"
+PREFIX_PATTERN = re.compile(r"^DOMAINE: (?P<service>[^\n]*)\nSUJET: (?P<section>[^\n]*)\n---\n")
+# Phrases, ou lignes pour les listes à puces et les tableaux Markdown
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?;])\s+|\n+")
+# En dessous, un extrait n'apporte plus rien au générateur
+MIN_EXCERPT_TOKENS = 40
+
+def split_prefix(doc: Document) -> Tuple[Optional[str], Optional[str], str]:
+    match = PREFIX_PATTERN.match(doc.page_content)
+    if not match:
+        return doc.metadata.get("service"), doc.metadata.get("section"), doc.page_content
+    body = doc.page_content[match.end():].strip()
+    section = match.group("section").strip()
+    # strip_headers=False : le titre "## Section" répète la ligne SUJET
+    first_line, _, rest = body.partition("\n")
+    if first_line.lstrip("#").strip() == section:
+        body = rest.strip()
+    return match.group("service").strip(), section, body
+
+class ContextPacker:
+    """Assembles the generator context under a token budget, best reranked chunks first."""
+
+    def __init__(self, max_tokens: int = settings.CONTEXT_TOKEN_BUDGET):
+        self.max_tokens = max_tokens
+
+    def pack(self, question: str, docs: List[Document]) -> str:
+        # Cohere et le cross-encoder local posent relevance_score ; sinon on garde l'ordre du reranker
+        ranked = sorted(
+            enumerate(docs),
+            key=lambda item: (-item[1].metadata.get("relevance_score", 0.0), item[0])
+        )
+        question_terms = {term for term in tokenize(question) if len(term) > 3}
+
+        parts, used = [], 0
+        last_service = None
+        for _, doc in ranked:
+            service, section, body = split_prefix(doc)
+            # Le domaine n'est répété que lorsqu'il change d'un extrait à l'autre
+            header = f"SUJET: {section}\n" if section else ""
+            if service and service != last_service:
+                header = f"DOMAINE: {service}\n" + header
+            remaining = self.max_tokens - used - estimate_tokens(header)
+            if remaining < MIN_EXCERPT_TOKENS:
+                RAG_CONTEXT_CHUNKS.labels(outcome="dropped").inc()
+                continue
+
+            if estimate_tokens(body) > remaining:
+                body = self.trim(body, question_terms, remaining)
+                RAG_CONTEXT_CHUNKS.labels(outcome="trimmed").inc()
+            else:
+                RAG_CONTEXT_CHUNKS.labels(outcome="kept").inc()
+            if not body:
+                continue
+
+            part = f"{header}{body}"
+            parts.append(part)
+            used += estimate_tokens(part)
+            last_service = service or last_service
+
+        context = "\n\n".join(parts)
+        RAG_CONTEXT_TOKENS.observe(estimate_tokens(context))
+        return context
+
+    @staticmethod
+    def trim(body: str, question_terms: set, budget: int) -> str:
+        """Keeps the sentences sharing the most terms with the question, in their original order."""
+        sentences = [s.strip() for s in SENTENCE_SPLIT.split(body) if s and s.strip()]
+        scored = sorted(
+            range(len(sentences)),
+            key=lambda i: (-len(question_terms & set(tokenize(sentences[i]))), i)
+        )
+
+        selected, used = set(), 0
+        for i in scored:
+            cost = estimate_tokens(sentences[i])
+            if used + cost <= budget:
+                selected.add(i)
+                used += cost
+        return "\n".join(sentences[i] for i in sorted(selected))
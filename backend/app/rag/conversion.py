@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+from importlib.metadata import version
+from docling.document_converter import DocumentConverter
+from app.core.config import settings
+
+DOCLING_VERSION = version("docling")
+
+def pdf_hash(pdf_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cache_key(pdf_path: str) -> str:
+    # Une nouvelle version de Docling peut changer le markdown produit : elle invalide le cache
+    return f"{pdf_hash(pdf_path)}-docling{DOCLING_VERSION}"
+
+def atomic_write(path: str, content: str):
+    # Fichier temporaire propre au processus puis renommage : jamais de fichier tronqué visible,
+    # même si un autre worker du pool convertit le même PDF en parallèle
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def read_cached(markdown_path: str, meta_path: str):
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(markdown_path, encoding="utf-8") as f:
+            return f.read(), meta["num_pages"]
+    except (OSError, ValueError, KeyError):
+        # Entrée absente ou illisible (écriture interrompue d'une ancienne version) : reconversion
+        return None
+
+def convert_pdf(pdf_path: str, cache_dir: str = settings.CONVERSION_CACHE_DIR):
+    """Returns (markdown, page count) for a PDF, running Docling only on a cache miss."""
+    key = cache_key(pdf_path)
+    markdown_path = os.path.join(cache_dir, f"{key}.md")
+    meta_path = os.path.join(cache_dir, f"{key}.meta.json")
+
+    cached = read_cached(markdown_path, meta_path)
+    if cached is not None:
+        print(f"Conversion cache hit: {pdf_path}")
+        return cached
+
+    print(f"Converting PDF: {pdf_path}")
+    converter = DocumentConverter()
+    result = converter.convert(pdf_path)
+    markdown_content = result.document.export_to_markdown()
+    num_pages = result.document.num_pages()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Le DoclingDocument complet est gardé pour les expériences de chunking structurelles
+    result.document.save_as_json(os.path.join(cache_dir, f"{key}.json"))
+    atomic_write(markdown_path, markdown_content)
+    # Écrit en dernier : sa présence garantit que l'entrée est complète
+    atomic_write(meta_path, json.dumps({"source": os.path.basename(pdf_path), "num_pages": num_pages, "docling_version": DOCLING_VERSION}))
+
+    return markdown_content, num_pages
@@ -0,0 +1,46 @@
+from typing import Optional
+from app.rag.cache import normalize_question
+
+# Domaines canoniques posés en métadonnée "domain" à l'ingestion (filtre Chroma `where`)
+SERVICE_DOMAINS = ["PÉDIATRIE", "DENTAIRE", "MÉDECINE", "URGENCE"]
+DEFAULT_DOMAIN = "GÉNÉRAL"
+
+# Indices lexicaux (forme normalisée, sans accents) pour deviner le domaine d'une question
+DOMAIN_KEYWORDS = {
+    "PÉDIATRIE": [
+        "enfant", "enfants", "nourrisson", "nourrissons", "bebe", "bebes", "nouveau ne", "neonatal",
+        "pediatrie", "pediatrique", "adolescent"
+    ],
+    "DENTAIRE": [
+        "dent", "dents", "dentaire", "dentaires", "gencive", "gencives", "carie", "pulpite",
+        "extraction dentaire", "stomatologie", "parodontal", "alveolite"
+    ],
+    "URGENCE": [
+        "urgence", "urgences", "samu", "reanimation", "arret cardiaque", "arret cardio respiratoire",
+        "polytraumatise", "detresse respiratoire", "etat de choc", "coma"
+    ],
+    "MÉDECINE": ["medecine generale", "medecin generaliste", "consultation de medecine"],
+}
+
+def canonical_domain(service: str) -> Optional[str]:
+    """Maps a service label ("Pédiatrie", "URGENCES PÉDIATRIQUES"…) to its canonical domain, or None."""
+    text = normalize_question(service)
+    for domain in SERVICE_DOMAINS:
+        if normalize_question(domain) in text:
+            return domain
+    if normalize_question(DEFAULT_DOMAIN) in text:
+        return DEFAULT_DOMAIN
+    return None
+
+def detect_domain(question: str) -> Optional[str]:
+    """Guesses the domain of a question; returns None when no domain or several domains match."""
+    text = f" {normalize_question(question)} "
+    matches = {
+        domain for domain, keywords in DOMAIN_KEYWORDS.items()
+        if any(f" {keyword} " in text for keyword in keywords)
+    }
+    # Ambiguïté ("choc chez l'enfant") : pas de filtre plutôt qu'un filtre qui ferait perdre les bons chunks
+    return matches.pop() if len(matches) == 1 else None
+
+def domain_filter(domain: Optional[str]) -> Optional[dict]:
+    return {"domain": domain} if domain else None
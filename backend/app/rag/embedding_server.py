@@ -0,0 +1,48 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from prometheus_fastapi_instrumentator import Instrumentator
+from pydantic import BaseModel
+from app.core.config import settings
+from app.core.resources import resources
+from app.rag.embeddings import build_batching_embeddings, embedding_model_key
+
+# Sidecar d'embeddings : un seul BGE-M3 (torch ou ONNX) partagé par tous les workers de l'API
+# et par l'ingestion. Lancement : uvicorn app.rag.embedding_server:app --port 8001
+BATCHER_RESOURCE = "embedding_batcher"
+resources.register(BATCHER_RESOURCE, build_batching_embeddings)
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+
+class EmbedResponse(BaseModel):
+    model: str
+    vectors: List[List[float]]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup = asyncio.create_task(resources.warm_up([BATCHER_RESOURCE]))
+    yield
+    if not warmup.done():
+        warmup.cancel()
+
+app = FastAPI(title="CliniQ Embedding Server", version="1.0.0", lifespan=lifespan)
+
+@app.post("/embed", response_model=EmbedResponse)
+async def embed(request: EmbedRequest):
+    batcher = await resources.aget(BATCHER_RESOURCE)
+    # Les requêtes concurrentes sont regroupées par le micro-batcher en un seul forward pass
+    vectors = await asyncio.wrap_future(batcher.submit(request.texts))
+    return {"model": embedding_model_key(), "vectors": vectors}
+
+@app.get("/health/ready")
+def readiness():
+    ready = resources.is_loaded(BATCHER_RESOURCE)
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "loading", "backend": settings.EMBEDDING_BACKEND}
+    )
+
+Instrumentator().instrument(app).expose(app)
@@ -0,0 +1,258 @@
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+import httpx
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from app.core.config import settings
+from app.core.resources import resources
+from app.rag.metrics import RAG_EMBEDDING_BATCH_SIZE
+
+# Nom du modèle partagé dans le registre : BGE-M3 n'est chargé qu'une fois par worker
+EMBEDDINGS_RESOURCE = "embeddings"
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingStore:
+    """SQLite store of embeddings keyed by (model, normalize flag, sha256 of text)."""
+
+    # Limite de variables SQLite par requête
+    BATCH_SIZE = 500
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Partagée entre les threads de asyncio.to_thread, protégée par un verrou
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, normalized INTEGER NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, normalized, text_hash))"
+            )
+
+    def get_many(self, model: str, normalized: bool, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self.lock:
+            for i in range(0, len(hashes), self.BATCH_SIZE):
+                batch = hashes[i:i + self.BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND normalized = ? AND text_hash IN ({placeholders})",
+                    [model, int(normalized), *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, normalized: bool, vectors: Dict[str, List[float]]):
+        rows = [
+            (model, int(normalized), text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+            for text_hash, vector in vectors.items()
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding model so that already-seen texts are read from the store instead of re-encoded."""
+
+    def __init__(self, embeddings: Embeddings, store: EmbeddingStore, model_name: str, normalized: bool):
+        self.embeddings = embeddings
+        self.store = store
+        self.model_name = model_name
+        self.normalized = normalized
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [content_hash(text) for text in texts]
+        found = self.store.get_many(self.model_name, self.normalized, list(set(hashes)))
+
+        # Un seul forward pass pour les textes jamais vus (dédupliqués)
+        missing = {h: text for h, text in zip(hashes, texts) if h not in found}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.store.put_many(self.model_name, self.normalized, computed)
+            found.update(computed)
+
+        return [found[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+class MicroBatchingEmbeddings(Embeddings):
+    """Coalesces concurrent embed calls, from any thread, into a single forward pass of the wrapped model."""
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, texts: List[str]) -> Future:
+        # Futur résolu par le worker : utilisable en synchrone (.result()) ou en async (asyncio.wrap_future)
+        future = Future()
+        if not texts:
+            future.set_result([])
+            return future
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+        self._queue.put((list(texts), future))
+        return future
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.submit(texts).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            # Attend quelques millisecondes les requêtes concurrentes avant le forward pass
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._process(batch)
+
+    def _process(self, batch):
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        RAG_EMBEDDING_BATCH_SIZE.observe(len(texts))
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for request_texts, future in batch:
+            future.set_result(vectors[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+class OnnxEmbeddings(Embeddings):
+    """BGE-M3 dense embeddings (CLS pooling, L2-normalized) through ONNX Runtime, fp32 or int8-quantized."""
+
+    def __init__(self, model_dir: str, quantized: bool = False, batch_size: int = 32, max_length: int = 8192):
+        # Dépendances optionnelles : seulement nécessaires avec EMBEDDING_BACKEND="onnx" / "onnx-int8"
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("Le backend ONNX nécessite onnxruntime et transformers (pip install onnxruntime).") from e
+
+        model_file = os.path.join(model_dir, "model_quantized.onnx" if quantized else "model.onnx")
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(f"Modèle ONNX introuvable : {model_file} (voir app.scripts.export_onnx)")
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(model_file, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer(
+                texts[i:i + self.batch_size], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="np"
+            )
+            feeds = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            # Pooling CLS puis normalisation, comme la config sentence-transformers de BGE-M3
+            cls = hidden[:, 0]
+            cls = cls / np.linalg.norm(cls, axis=1, keepdims=True)
+            vectors.extend(cls.astype(np.float32).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+class RemoteEmbeddings(Embeddings):
+    """Client of the embedding sidecar (app.rag.embedding_server): no model is loaded in this process."""
+
+    def __init__(self, base_url: str, timeout: float = 60.0):
+        self.client = httpx.Client(base_url=base_url, timeout=timeout)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        response = self.client.post("/embed", json={"texts": texts})
+        response.raise_for_status()
+        payload = response.json()
+        # Le cache et Chroma sont indexés par la clé locale : des vecteurs d'un autre backend s'y mélangeraient
+        if payload["model"] != embedding_model_key():
+            raise RuntimeError(
+                f"Le sidecar d'embeddings sert {payload['model']} alors que l'API attend {embedding_model_key()} "
+                "(EMBEDDING_BACKEND différent ?)"
+            )
+        return payload["vectors"]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+def embedding_model_key(backend: Optional[str] = None) -> str:
+    # Les vecteurs int8/ONNX diffèrent légèrement des vecteurs torch : clés de cache séparées
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == "torch":
+        return settings.EMBEDDING_MODEL
+    return f"{settings.EMBEDDING_MODEL}:{backend}"
+
+def build_model_embeddings() -> Embeddings:
+    """Loads BGE-M3 in this process with the configured backend ("torch", "onnx" or "onnx-int8")."""
+    backend = settings.EMBEDDING_BACKEND
+    if backend == "torch":
+        return HuggingFaceEmbeddings(
+            model_name=settings.EMBEDDING_MODEL,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True}
+        )
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbeddings(settings.EMBEDDING_ONNX_PATH, quantized=backend == "onnx-int8")
+    raise ValueError(f"EMBEDDING_BACKEND inconnu : {backend}")
+
+def build_batching_embeddings() -> MicroBatchingEmbeddings:
+    return MicroBatchingEmbeddings(
+        build_model_embeddings(),
+        max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+        max_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS
+    )
+
+def build_embeddings() -> Embeddings:
+    """Builds the BGE-M3 embedder shared by ingestion and retrieval, backed by the persistent cache."""
+    if settings.EMBEDDING_SERVER_URL:
+        # Sidecar : un seul modèle en mémoire pour tous les workers uvicorn et l'ingestion
+        embeddings = RemoteEmbeddings(settings.EMBEDDING_SERVER_URL)
+    else:
+        embeddings = build_batching_embeddings()
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return embeddings
+
+    # Mode éphémère (RAM) pour GitHub Actions
+    path = ":memory:" if os.getenv("IS_TESTING") == "True" else settings.EMBEDDING_CACHE_PATH
+    return CachedEmbeddings(embeddings, EmbeddingStore(path), embedding_model_key(), normalized=True)
+
+resources.register(EMBEDDINGS_RESOURCE, build_embeddings)
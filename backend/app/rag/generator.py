@@ -3,7 +3,10 @@ from langchain_core.prompts import PromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
 from app.core.config import settings
 from langchain_groq import ChatGroq
+import time
 import mlflow
+from app.rag.context import ContextPacker
+from app.rag.metrics import RAG_EXTERNAL_ERRORS, RAG_STAGE_LATENCY, track_stage
 
 class MedicalGenerator:
     def __init__(self):
@@ -22,6 +25,9 @@ class MedicalGenerator:
             model_name="llama-3.3-70b-versatile",
             temperature=0.2
         )
+        # Le modèle réellement appelé (et non GENERATOR_MODEL, inutilisé tant que Gemini est commenté)
+        # étiquette les métriques Prometheus, les logs et les paramètres MLflow
+        self.model_name = self.llm.model_name
         
         template = """VOUS ÊTES UN EXPERT EN AIDE À LA DÉCISION CLINIQUE (CDSS).
         Votre mission est de transformer des extraits de protocoles en une réponse synthétique, lisible et actionnable pour un médecin urgentiste.
@@ -56,19 +62,49 @@ class MedicalGenerator:
         # Chain composition using LCEL
         self.chain = self.prompt | self.llm
 
-    def generate(self, question, docs):
-        # Synthesis of top-ranked clinical chunks
-        context_text = "\n\n".join([doc.page_content for doc in docs])
+        # Contexte borné en tokens : taille de prompt, latence et coût Groq prévisibles
+        self.packer = ContextPacker()
+
+    async def agenerate(self, question, docs):
+        # Synthesis of top-ranked clinical chunks, within the context token budget
+        context_text = self.packer.pack(question, docs)
         
         print(f"✍️ [Phase 4: Génération] Synthèse clinique via {self.model_name}...")
-        response = self.chain.invoke({"context": context_text, "question": question})
+        with track_stage("generation", self.model_name):
+            response = await self.chain.ainvoke({"context": context_text, "question": question})
         
         return response.content
+
+    async def astream(self, question, docs):
+        # Same prompt as agenerate, but tokens are yielded as soon as Groq emits them
+        context_text = self.packer.pack(question, docs)
+
+        print(f"✍️ [Phase 4: Génération] Synthèse clinique en streaming via {self.model_name}...")
+        # Pas de span ici : un générateur suspendu entre deux yields ne garde pas son contexte OTel
+        start = time.perf_counter()
+        first_token = True
+        try:
+            async for chunk in self.chain.astream({"context": context_text, "question": question}):
+                if chunk.content:
+                    if first_token:
+                        RAG_STAGE_LATENCY.labels(stage="first_token", model=self.model_name).observe(time.perf_counter() - start)
+                        first_token = False
+                    yield chunk.content
+        except Exception:
+            RAG_EXTERNAL_ERRORS.labels(stage="generation", model=self.model_name).inc()
+            raise
+        finally:
+            RAG_STAGE_LATENCY.labels(stage="generation", model=self.model_name).observe(time.perf_counter() - start)
     
-    def log_params(self):
-        """Logs the actual live parameters to MLflow"""
-        mlflow.log_params({
+    def get_params(self):
+        """The actual live generation parameters"""
+        return {
             "generator_model": self.model_name,
             "generator_temperature": self.temperature,
-            "template_version": "v1-clinical-strict"
-        })
\ No newline at end of file
+            "template_version": "v1-clinical-strict",
+            "context_token_budget": self.packer.max_tokens
+        }
+
+    def log_params(self):
+        """Logs the parameters to the active MLflow run"""
+        mlflow.log_params(self.get_params())
@@ -1,57 +1,250 @@
+import argparse
+import glob
+import hashlib
+import multiprocessing
 import os
+import queue
 import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import mlflow
-from docling.document_converter import DocumentConverter
+from langchain_core.documents import Document
 from langchain_text_splitters import MarkdownHeaderTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from app.core.config import settings
+from app.rag.cache import mark_collection_rebuilt
+from app.rag.embeddings import build_embeddings, embedding_model_key
+from app.rag.conversion import convert_pdf
+from app.rag.lexical import BM25_INDEX_FILE, BM25Index
+from app.rag.domains import DEFAULT_DOMAIN, SERVICE_DOMAINS, canonical_domain
 
 # Configuration from paths
-PDF_PATH = "/app/data/raw_pdfs/guide_medical.pdf"
-CHROMA_PERSIST_DIR = "/app/chroma_db"
+RAW_PDF_DIR = "/app/data/raw_pdfs"
+CHROMA_PERSIST_DIR = settings.CHROMA_PERSIST_DIR
 
-def process_medical_pdf(pdf_path: str):
-    print(f"Converting PDF: {pdf_path}")
-    converter = DocumentConverter()
-    result = converter.convert(pdf_path)
-    markdown_content = result.document.export_to_markdown()
+# Pipeline defaults (overridable from the CLI)
+DEFAULT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_QUEUE_SIZE = 8
+
+# Marks the end of a stage's output on the inter-stage queues
+END_OF_STREAM = None
 
+def chunk_markdown(markdown_content: str, pdf_path: str):
     # Strategy: Markdown Header-Based Segmentation
     headers_to_split_on = [("##", "header_title")]
     splitter = MarkdownHeaderTextSplitter(
-        headers_to_split_on=headers_to_split_on, 
+        headers_to_split_on=headers_to_split_on,
         strip_headers=False
     )
-    
+
     raw_chunks = splitter.split_text(markdown_content)
     final_documents = []
     current_service = "Général"
-    
-    service_keywords = ["PÉDIATRIE", "DENTAIRE", "MÉDECINE", "URGENCE"]
+    current_domain = DEFAULT_DOMAIN
 
     for chunk in raw_chunks:
         header = chunk.metadata.get("header_title", "").strip()
-        header_upper = header.upper()
 
-        if any(keyword in header_upper for keyword in service_keywords):
+        domain = canonical_domain(header)
+        if domain in SERVICE_DOMAINS:
             current_service = header
-        
+            current_domain = domain
+
         chunk.metadata["service"] = current_service
+        # Valeur canonique filtrable par Chroma (`where`), le titre du service pouvant varier d'un guide à l'autre
+        chunk.metadata["domain"] = current_domain
         chunk.metadata["section"] = header
         chunk.metadata["source"] = pdf_path
-        
+
         context_prefix = f"DOMAINE: {current_service}\nSUJET: {header}\n"
         chunk.page_content = f"{context_prefix}---\n{chunk.page_content}"
         chunk.page_content = re.sub(r'\n{3,}', '\n\n', chunk.page_content)
-        
+
         final_documents.append(chunk)
 
     return final_documents
 
-def ingest_to_chroma():
-    if not os.path.exists(PDF_PATH):
-        print(f"Error: PDF not found at {PDF_PATH}")
+def process_medical_pdf(pdf_path: str):
+    markdown_content, _ = convert_pdf(pdf_path)
+    return chunk_markdown(markdown_content, pdf_path)
+
+def _convert_and_chunk(pdf_path: str):
+    # Runs in a worker process: Docling layout analysis is CPU-bound and single-threaded per document
+    # (unchanged PDFs are read back from the conversion cache)
+    markdown_content, num_pages = convert_pdf(pdf_path)
+    return chunk_markdown(markdown_content, pdf_path), num_pages
+
+def assign_chunk_ids(chunks):
+    """Derives a stable ID per chunk from its source and section, and stores its content hash."""
+    ids = []
+    occurrences = Counter()
+    model_key = embedding_model_key()
+    for chunk in chunks:
+        source = os.path.basename(chunk.metadata["source"])
+        section_key = f"{source}|{chunk.metadata['service']}|{chunk.metadata['section']}"
+        # Un même titre peut apparaître plusieurs fois dans un guide
+        occurrences[section_key] += 1
+        chunk_key = f"{section_key}|{occurrences[section_key]}"
+
+        # Le domaine et le modèle d'embedding entrent dans l'empreinte : un changement de métadonnées
+        # filtrables ou de EMBEDDING_BACKEND (torch -> onnx-int8) force le ré-encodage et l'upsert
+        chunk.metadata["embedding_model"] = model_key
+        fingerprint = f"{model_key}|{chunk.metadata.get('domain', '')}|{chunk.page_content}"
+        chunk.metadata["content_hash"] = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+        ids.append(hashlib.sha256(chunk_key.encode("utf-8")).hexdigest()[:32])
+    return ids
+
+def diff_chunks(chunks, ids, existing_hashes):
+    """Compares freshly generated chunks with the stored {id: content_hash} map."""
+    to_upsert, upsert_ids = [], []
+    added = updated = 0
+    for chunk, chunk_id in zip(chunks, ids):
+        if chunk_id not in existing_hashes:
+            added += 1
+        elif existing_hashes[chunk_id] != chunk.metadata["content_hash"]:
+            updated += 1
+        else:
+            continue
+        to_upsert.append(chunk)
+        upsert_ids.append(chunk_id)
+
+    return to_upsert, upsert_ids, {
+        "chunks_added": added,
+        "chunks_updated": updated,
+        "chunks_unchanged": len(chunks) - added - updated
+    }
+
+def stale_chunk_ids(existing_sources, seen_ids, failed_sources):
+    """Stored chunks that no PDF produced anymore; sources that failed to convert are left untouched."""
+    return sorted(
+        chunk_id for chunk_id, source in existing_sources.items()
+        if chunk_id not in seen_ids and source not in failed_sources
+    )
+
+class IngestionReport:
+    """Thread-safe progress and throughput counters shared by the pipeline stages."""
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.chunks = 0
+        self.counts = Counter()
+        self.seen_ids = set()
+        self.failed_sources = set()
+
+    def add_document(self, num_pages: int):
+        with self.lock:
+            self.pages += num_pages
+
+    def add_batch(self, ids, counts):
+        with self.lock:
+            self.chunks += len(ids)
+            self.seen_ids.update(ids)
+            self.counts.update(counts)
+
+    def throughput(self):
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        return {
+            "pages_per_second": self.pages / elapsed,
+            "chunks_per_second": self.chunks / elapsed,
+            "elapsed_seconds": elapsed
+        }
+
+    def print_progress(self):
+        rates = self.throughput()
+        print(
+            f"   -> {self.pages} pages | {self.chunks} chunks | "
+            f"{rates['pages_per_second']:.2f} pages/s | {rates['chunks_per_second']:.2f} chunks/s"
+        )
+
+def _drain(stage_queue):
+    # Unblocks an upstream stage after a downstream failure
+    while stage_queue.get() is not END_OF_STREAM:
+        pass
+
+def _produce_chunks(pdf_paths, workers, batch_size, chunk_queue, report):
+    """Stage 1: converts PDFs across a process pool and streams chunk batches downstream."""
+    try:
+        # spawn: the parent already holds the embedding model and torch threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {pool.submit(_convert_and_chunk, path): path for path in pdf_paths}
+            for future in as_completed(futures):
+                pdf_path = futures[future]
+                try:
+                    chunks, num_pages = future.result()
+                except Exception as e:
+                    print(f"Error: conversion failed for {pdf_path}: {e}")
+                    report.failed_sources.add(os.path.basename(pdf_path))
+                    continue
+
+                ids = assign_chunk_ids(chunks)
+                report.add_document(num_pages)
+                for i in range(0, len(chunks), batch_size):
+                    # Blocks when the embedding stage lags behind (bounded queue)
+                    chunk_queue.put((chunks[i:i + batch_size], ids[i:i + batch_size]))
+    finally:
+        chunk_queue.put(END_OF_STREAM)
+
+def _embed_batches(chunk_queue, write_queue, embeddings_model, existing_hashes, report):
+    """Stage 2: keeps only new or changed chunks and embeds them one batch at a time."""
+    try:
+        while (item := chunk_queue.get()) is not END_OF_STREAM:
+            chunks, ids = item
+            to_upsert, upsert_ids, counts = diff_chunks(chunks, ids, existing_hashes)
+            if to_upsert:
+                vectors = embeddings_model.embed_documents([chunk.page_content for chunk in to_upsert])
+                write_queue.put((to_upsert, upsert_ids, vectors))
+            report.add_batch(ids, counts)
+            report.print_progress()
+    except Exception:
+        _drain(chunk_queue)
+        raise
+    finally:
+        write_queue.put(END_OF_STREAM)
+
+def _write_batches(write_queue, vector_store):
+    """Stage 3: upserts pre-computed embeddings into Chroma, one batch per call."""
+    written = 0
+    try:
+        while (item := write_queue.get()) is not END_OF_STREAM:
+            chunks, ids, vectors = item
+            vector_store._collection.upsert(
+                ids=ids,
+                embeddings=vectors,
+                documents=[chunk.page_content for chunk in chunks],
+                metadatas=[chunk.metadata for chunk in chunks]
+            )
+            written += len(ids)
+    except Exception:
+        _drain(write_queue)
+        raise
+    return written
+
+def build_bm25_index(vector_store, path: str):
+    stored = vector_store.get(include=["documents", "metadatas"])
+    documents = [
+        Document(page_content=text, metadata=metadata or {})
+        for text, metadata in zip(stored["documents"], stored["metadatas"])
+    ]
+    print(f"Building BM25 index over {len(documents)} chunks: {path}")
+    index = BM25Index(documents)
+    index.save(path)
+    mlflow.log_metric("bm25_vocabulary_size", len(index.postings))
+
+def ingest_to_chroma(
+    pdf_dir: str = RAW_PDF_DIR,
+    workers: int = DEFAULT_WORKERS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    queue_size: int = DEFAULT_QUEUE_SIZE
+):
+    pdf_paths = sorted(glob.glob(os.path.join(pdf_dir, "*.pdf")))
+    if not pdf_paths:
+        print(f"Error: no PDF found in {pdf_dir}")
         return
 
     # --- MLflow Ingestion Logging ---
@@ -64,41 +257,89 @@ def ingest_to_chroma():
             "chunk_strategy": "Markdown_Header_Splitter",
             "header_level": "H2 (##)",
             "context_injection": "True",
-            "source_file": os.path.basename(PDF_PATH)
+            "source_files": ",".join(os.path.basename(path) for path in pdf_paths),
+            "sync_mode": "incremental",
+            "conversion_workers": workers,
+            "batch_size": batch_size
         })
 
-        # Process chunks
-        chunks = process_medical_pdf(PDF_PATH)
-        print(f"Generated {len(chunks)} semantic blocks.")
-        mlflow.log_metric("total_chunks", len(chunks))
-
         # Initialize Embedding Model using Settings
         print(f"Loading embedding model: {settings.EMBEDDING_MODEL}")
-        embeddings_model = HuggingFaceEmbeddings(
-            model_name=settings.EMBEDDING_MODEL,
-            model_kwargs={'device': 'cpu'}, 
-            encode_kwargs={'normalize_embeddings': True}
-        )
+        # Les chunks inchangés sont relus depuis le cache d'embeddings au lieu d'être ré-encodés
+        embeddings_model = build_embeddings()
 
         # Logging Embedding Hyperparameters
         mlflow.log_params({
             "embedding_model": settings.EMBEDDING_MODEL,
+            "embedding_backend": settings.EMBEDDING_BACKEND,
             "dimension": 1024, # BGE-M3 standard
-            "normalization": "True"
-        })  
-
-        # Persist to vector store
-        print(f"Saving to vector store: {CHROMA_PERSIST_DIR}")
-        vector_store = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings_model,
-            persist_directory=CHROMA_PERSIST_DIR
+            "normalization": "True",
+            "embedding_cache": settings.EMBEDDING_CACHE_ENABLED
+        })
+
+        # Diff against what is already persisted: only changed sections are embedded
+        print(f"Syncing vector store: {CHROMA_PERSIST_DIR}")
+        vector_store = Chroma(
+            persist_directory=CHROMA_PERSIST_DIR,
+            embedding_function=embeddings_model
         )
-        
+        stored = vector_store.get(include=["metadatas"])
+        existing_hashes, existing_sources = {}, {}
+        for chunk_id, metadata in zip(stored["ids"], stored["metadatas"]):
+            metadata = metadata or {}
+            existing_hashes[chunk_id] = metadata.get("content_hash")
+            existing_sources[chunk_id] = os.path.basename(metadata.get("source", ""))
+
+        # Conversion (process pool) -> embedding -> Chroma writer, linked by bounded queues
+        print(f"Processing {len(pdf_paths)} PDF(s) with {workers} conversion worker(s)...")
+        report = IngestionReport()
+        chunk_queue = queue.Queue(maxsize=queue_size)
+        write_queue = queue.Queue(maxsize=queue_size)
+        with ThreadPoolExecutor(max_workers=2) as stages:
+            producer = stages.submit(_produce_chunks, pdf_paths, workers, batch_size, chunk_queue, report)
+            embedder = stages.submit(
+                _embed_batches, chunk_queue, write_queue, embeddings_model, existing_hashes, report
+            )
+            written = _write_batches(write_queue, vector_store)
+            producer.result()
+            embedder.result()
+
+        removed_ids = stale_chunk_ids(existing_sources, report.seen_ids, report.failed_sources)
+        if removed_ids:
+            vector_store.delete(ids=removed_ids)
+
+        counts = {**report.counts, "chunks_removed": len(removed_ids)}
+        print(f"Generated {report.chunks} semantic blocks from {len(pdf_paths)} PDF(s).")
+        print(" | ".join(f"{name}={value}" for name, value in counts.items()))
+        report.print_progress()
+        mlflow.log_metric("total_chunks", report.chunks)
+        mlflow.log_metric("failed_documents", len(report.failed_sources))
+        mlflow.log_metrics(counts)
+        mlflow.log_metrics(report.throughput())
+
+        bm25_path = os.path.join(CHROMA_PERSIST_DIR, BM25_INDEX_FILE)
+        if removed_ids or written or not os.path.exists(bm25_path):
+            # L'index lexical est reconstruit à partir de la collection synchronisée
+            build_bm25_index(vector_store, bm25_path)
+
+        if removed_ids or written:
+            # Les réponses mises en cache par l'API reposent sur l'ancienne collection
+            mark_collection_rebuilt(CHROMA_PERSIST_DIR)
+
         # Save the LangChain pipeline structure to MLflow
-        mlflow.log_artifact(PDF_PATH, "source_documents")
-        
+        for pdf_path in pdf_paths:
+            mlflow.log_artifact(pdf_path, "source_documents")
+
         print("Ingestion complete. Metrics logged to MLflow.")
 
+def main():
+    parser = argparse.ArgumentParser(description="Incremental ingestion of protocol PDFs into ChromaDB.")
+    parser.add_argument("--pdf-dir", default=RAW_PDF_DIR, help="Directory containing the protocol PDFs")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Docling conversion processes")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per embedding/write batch")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="Batches buffered between stages")
+    args = parser.parse_args()
+    ingest_to_chroma(args.pdf_dir, args.workers, args.batch_size, args.queue_size)
+
 if __name__ == "__main__":
-    ingest_to_chroma()
\ No newline at end of file
+    main()
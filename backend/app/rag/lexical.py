@@ -0,0 +1,95 @@
+import heapq
+import json
+import math
+import os
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+from langchain_core.documents import Document
+from app.rag.cache import normalize_question
+
+# Index lexical persisté dans le répertoire Chroma, reconstruit à chaque ingestion
+BM25_INDEX_FILE = "bm25_index.json"
+
+# Constante standard de la Reciprocal Rank Fusion
+RRF_K = 60
+
+def tokenize(text: str) -> List[str]:
+    # Minuscules, sans accents ni ponctuation : "Amoxicilline 50mg/kg" -> ["amoxicilline", "50mg", "kg"]
+    return normalize_question(text).split()
+
+class BM25Index:
+    """In-process Okapi BM25 inverted index over the ingested chunks."""
+
+    def __init__(self, documents: List[Document], k1: float = 1.5, b: float = 0.75):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = []
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+
+        for idx, doc in enumerate(documents):
+            tokens = tokenize(doc.page_content)
+            self.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term][idx] = tf
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if documents else 0.0
+
+    def matches(self, idx: int, where: Optional[dict]) -> bool:
+        # Même sémantique d'égalité que le `where` Chroma, pour les filtres simples {"champ": valeur}
+        metadata = self.documents[idx].metadata
+        return not where or all(metadata.get(key) == value for key, value in where.items())
+
+    def search(self, query: str, k: int, where: Optional[dict] = None) -> List[Document]:
+        scores = defaultdict(float)
+        n_docs = len(self.documents)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for idx, tf in postings.items():
+                if where and not self.matches(idx, where):
+                    continue
+                length_norm = 1 - self.b + self.b * self.doc_lengths[idx] / self.avg_length
+                scores[idx] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self.documents[idx] for idx, _ in best]
+
+    def save(self, path: str):
+        payload = {
+            "k1": self.k1,
+            "b": self.b,
+            "documents": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in self.documents],
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        # Remplacement atomique : l'API ne lit jamais un index à moitié écrit
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+
+        index = cls.__new__(cls)
+        index.k1 = payload["k1"]
+        index.b = payload["b"]
+        index.documents = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in payload["documents"]]
+        index.doc_lengths = payload["doc_lengths"]
+        index.postings = {term: {int(idx): tf for idx, tf in docs.items()} for term, docs in payload["postings"].items()}
+        index.avg_length = sum(index.doc_lengths) / len(index.doc_lengths) if index.documents else 0.0
+        return index
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Document]], k: int = RRF_K) -> List[Document]:
+    """Merges dense and lexical rankings; documents are identified by their content."""
+    scores = defaultdict(float)
+    docs = {}
+    for ranking in ranked_lists:
+        for rank, doc in enumerate(ranking):
+            scores[doc.page_content] += 1 / (k + rank + 1)
+            docs.setdefault(doc.page_content, doc)
+    return [docs[content] for content in sorted(scores, key=scores.get, reverse=True)]
@@ -0,0 +1,55 @@
+import time
+from contextlib import contextmanager, nullcontext
+from prometheus_client import Counter, Histogram
+
+# OpenTelemetry est optionnel : sans SDK configuré, l'API fournit des spans no-op
+try:
+    from opentelemetry import trace
+    tracer = trace.get_tracer("cliniq.rag")
+except ImportError:
+    tracer = None
+
+# Métriques par étape pour savoir qui fait sauter l'alerte RAGHighLatency
+RAG_STAGE_LATENCY = Histogram(
+    'rag_stage_latency_seconds', 'Latence par étape du pipeline RAG', ['stage', 'model'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0)
+)
+RAG_CANDIDATES = Histogram(
+    'rag_retrieval_candidates', 'Nombre de candidats envoyés au reranker',
+    buckets=(1, 2, 3, 5, 8, 10, 15, 20, 30, 50)
+)
+RAG_CONTEXT_TOKENS = Histogram(
+    'rag_context_tokens', 'Taille estimée du contexte envoyé au générateur (tokens)',
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+)
+RAG_CONTEXT_CHUNKS = Counter(
+    'rag_context_chunks_total', 'Chunks rerankés gardés entiers, raccourcis ou écartés par le budget de contexte', ['outcome']
+)
+RAG_EMBEDDING_BATCH_SIZE = Histogram(
+    'rag_embedding_batch_size', 'Textes encodés par forward pass du micro-batcher',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+RAG_EXTERNAL_ERRORS = Counter(
+    'rag_external_call_errors_total', 'Erreurs des appels externes du pipeline RAG', ['stage', 'model']
+)
+
+def estimate_tokens(text: str) -> int:
+    # Approximation sans tokenizer distant : ~4 caractères par token pour le français
+    return max(1, len(text) // 4)
+
+@contextmanager
+def track_stage(stage: str, model: str):
+    """Times a pipeline stage, counts its failures and wraps it in an OpenTelemetry span when available."""
+    span_context = (
+        tracer.start_as_current_span(f"rag.{stage}", attributes={"rag.stage": stage, "rag.model": model})
+        if tracer is not None else nullcontext()
+    )
+    start = time.perf_counter()
+    with span_context as span:
+        try:
+            yield span
+        except Exception:
+            RAG_EXTERNAL_ERRORS.labels(stage=stage, model=model).inc()
+            raise
+        finally:
+            RAG_STAGE_LATENCY.labels(stage=stage, model=model).observe(time.perf_counter() - start)
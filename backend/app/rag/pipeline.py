@@ -1,33 +1,105 @@
+import asyncio
 import time
+from typing import Optional
 from prometheus_client import Counter, Gauge, Histogram
 from app.rag.retriever import MedicalRetriever
 from app.rag.generator import MedicalGenerator
+from app.rag.cache import AnswerCache
+from app.rag.domains import canonical_domain, detect_domain, domain_filter
+from app.core.config import settings
 
 # Initialisation des métriques applicatives pour Prometheus
 RAG_REQUEST_COUNT = Counter('rag_requests_total', 'Nombre total de requêtes RAG')
 RAG_FAITHFULNESS = Gauge('rag_faithfulness_score', 'Score de fidélité de la réponse')
 RAG_LATENCY = Histogram('rag_generation_latency_seconds', 'Temps de réponse total du pipeline')
+RAG_CACHE_HITS = Counter('rag_cache_hits_total', 'Réponses servies depuis le cache', ['level'])
+RAG_CACHE_MISSES = Counter('rag_cache_misses_total', 'Requêtes RAG non trouvées dans le cache')
 
 class MedicalPipeline:
     def __init__(self):
         self.retriever = MedicalRetriever()
         self.generator = MedicalGenerator()
+        self.cache = AnswerCache() if settings.ANSWER_CACHE_ENABLED else None
+        self.service_auto_detect = settings.SERVICE_AUTO_DETECT
 
-    def search(self, query: str):
+    def resolve_domain(self, query: str, service: Optional[str] = None) -> Optional[str]:
+        """Explicit service filter first, then (if enabled) the domain guessed from the question."""
+        if service:
+            domain = canonical_domain(service)
+            if domain is None:
+                raise ValueError(f"Service inconnu : {service}")
+            return domain
+        return detect_domain(query) if self.service_auto_detect else None
+
+    async def asearch(self, query: str, service: Optional[str] = None):
         # Incrémenter le compteur de requêtes
         RAG_REQUEST_COUNT.inc()
         start_time = time.time()
+        domain = self.resolve_domain(query, service)
 
         print("\n" + "="*50)
-        print(f"🚀 PIPELINE : {query}")
+        print(f"🚀 PIPELINE : {query}" + (f" [{domain}]" if domain else ""))
         print("="*50)
 
-        # 1. Get clinical chunks (Expansion + Retrieval + Reranking)
-        docs = self.retriever.get_relevant_documents(query)
+        cached, query_vector = await self._alookup_cache(query, domain, start_time)
+        if cached is not None:
+            return cached
+
+        # 1. Get clinical chunks (Expansion + Retrieval + Reranking), restreints au domaine s'il est connu
+        docs = await self.retriever.aget_relevant_documents(query, query_vector, domain_filter(domain))
 
         # 2. Generate final clinical answer
-        answer = self.generator.generate(query, docs)
+        answer = await self.generator.agenerate(query, docs)
+
+        return self._finalize(query, domain, query_vector, answer, docs, start_time)
+
+    async def astream_search(self, query: str, service: Optional[str] = None):
+        """Yields ("sources", metadata list), then ("token", text) chunks, then ("result", full result)."""
+        RAG_REQUEST_COUNT.inc()
+        start_time = time.time()
+        domain = self.resolve_domain(query, service)
+
+        print("\n" + "="*50)
+        print(f"🚀 PIPELINE (stream) : {query}" + (f" [{domain}]" if domain else ""))
+        print("="*50)
 
+        cached, query_vector = await self._alookup_cache(query, domain, start_time)
+        if cached is not None:
+            yield "sources", cached["sources"]
+            yield "token", cached["answer"]
+            yield "result", cached
+            return
+
+        docs = await self.retriever.aget_relevant_documents(query, query_vector, domain_filter(domain))
+        # Les sources partent avant la génération : le médecin voit les protocoles tout de suite
+        yield "sources", [doc.metadata for doc in docs]
+
+        parts = []
+        async for token in self.generator.astream(query, docs):
+            parts.append(token)
+            yield "token", token
+
+        yield "result", self._finalize(query, domain, query_vector, "".join(parts), docs, start_time)
+
+    async def _alookup_cache(self, query: str, domain: Optional[str], start_time: float):
+        """Returns (cached result or None, query embedding to reuse for retrieval)."""
+        if self.cache is None:
+            return None, None
+
+        # 0. Cache niveau 1 : question normalisée identique
+        cached = self.cache.get_exact(query, domain)
+        if cached is not None:
+            return self._cache_hit("exact", cached, start_time), None
+
+        # Cache niveau 2 : question sémantiquement proche (l'embedding est réutilisé par le retriever)
+        query_vector = (await self.retriever.vector_search.aembed_queries([query]))[0]
+        cached = self.cache.get_semantic(query_vector, domain)
+        if cached is not None:
+            return self._cache_hit("semantic", cached, start_time), query_vector
+        RAG_CACHE_MISSES.inc()
+        return None, query_vector
+
+    def _finalize(self, query: str, domain: Optional[str], query_vector, answer, docs, start_time: float):
         # Enregistrement de la latence
         latency = time.time() - start_time
         RAG_LATENCY.observe(latency)
@@ -36,10 +108,24 @@ class MedicalPipeline:
         # Cette valeur sera surveillée par vos alertes Prometheus
         RAG_FAITHFULNESS.set(1.0) 
 
-        return {
+        result = {
             "answer": answer,
-            "sources": [doc.metadata for doc in docs]
+            "sources": [doc.metadata for doc in docs],
+            "service": domain
         }
+        if self.cache is not None:
+            self.cache.put(query, query_vector, result, domain)
+        return result
+
+    def _cache_hit(self, level: str, result: dict, start_time: float):
+        print(f"⚡ [Cache] Réponse servie depuis le cache ({level}).")
+        RAG_CACHE_HITS.labels(level=level).inc()
+        RAG_LATENCY.observe(time.time() - start_time)
+        return result
+
+    def search(self, query: str, service: Optional[str] = None):
+        # Point d'entrée bloquant pour les scripts (évaluation, CLI)
+        return asyncio.run(self.asearch(query, service))
 
 # if __name__ == "__main__":
 #     pipeline = MedicalPipeline()
@@ -0,0 +1,61 @@
+from copy import deepcopy
+from typing import Any, Optional, Sequence
+from langchain_cohere import CohereRerank
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor, Document
+from pydantic import ConfigDict
+from app.core.config import settings
+
+# Les modèles Cohere sont tous préfixés "rerank-" (ex: rerank-multilingual-v3.0)
+COHERE_MODEL_PREFIX = "rerank-"
+
+class CrossEncoderReranker(BaseDocumentCompressor):
+    """Local CPU reranker: scores every (query, candidate) pair in a single cross-encoder forward pass."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model_name: str
+    top_n: int = 3
+    model: Any = None
+
+    def model_post_init(self, __context: Any):
+        if self.model is None:
+            from sentence_transformers import CrossEncoder
+            self.model = CrossEncoder(self.model_name, device="cpu")
+
+    def compress_documents(
+        self,
+        documents: Sequence[Document],
+        query: str,
+        callbacks: Optional[Callbacks] = None,
+    ) -> Sequence[Document]:
+        if not documents:
+            return []
+
+        pairs = [(query, doc.page_content) for doc in documents]
+        scores = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+
+        ranked = sorted(zip(documents, scores), key=lambda item: item[1], reverse=True)[:self.top_n]
+        compressed = []
+        for doc, score in ranked:
+            # Même contrat que CohereRerank : copie du document avec son score de pertinence
+            doc_copy = Document(doc.page_content, metadata=deepcopy(doc.metadata))
+            doc_copy.metadata["relevance_score"] = float(score)
+            compressed.append(doc_copy)
+        return compressed
+
+def is_cohere_model(model_name: str) -> bool:
+    return model_name.startswith(COHERE_MODEL_PREFIX)
+
+def build_reranker(model_name: str = settings.RERANK_MODEL, top_n: int = settings.RERANK_TOP_N) -> BaseDocumentCompressor:
+    """Cohere for "rerank-*" model names, a local HuggingFace cross-encoder otherwise."""
+    if is_cohere_model(model_name):
+        print(f"🎯 [Initialisation] Chargement du Reranker Cohere ({model_name})...")
+        return CohereRerank(
+            cohere_api_key=settings.COHERE_API_KEY,
+            model=model_name,
+            top_n=top_n
+        )
+
+    print(f"🎯 [Initialisation] Chargement du Reranker local ({model_name})...")
+    return CrossEncoderReranker(model_name=model_name, top_n=top_n)
@@ -1,13 +1,18 @@
+import asyncio
 import os
+import threading
 import warnings
-from typing import List
+from typing import List, Optional
 import mlflow
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_cohere import CohereRerank
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import PromptTemplate
 from app.core.config import settings
+from app.core.resources import resources
+from app.rag.embeddings import EMBEDDINGS_RESOURCE
+from app.rag.reranker import build_reranker
+from app.rag.lexical import BM25_INDEX_FILE, BM25Index, reciprocal_rank_fusion
+from app.rag.metrics import RAG_CANDIDATES, track_stage
 from langchain_groq import ChatGroq
 
 
@@ -34,6 +39,8 @@ class QueryExpander:
             model_name="llama-3.1-8b-instant", 
             temperature=0.1
         )
+        # Étiquette des métriques et des paramètres MLflow : le modèle Groq effectivement appelé
+        self.model_name = self.llm.model_name
 
 
 
@@ -48,10 +55,11 @@ class QueryExpander:
         )
         self.chain = self.prompt | self.llm
 
-    def expand(self, query: str) -> List[str]:
+    async def aexpand(self, query: str) -> List[str]:
         print(f"🧠 [Phase 1: Expansion] Reformulation via {self.model_name}...")
         try:
-            response = self.chain.invoke({"question": query})
+            with track_stage("expansion", self.model_name):
+                response = await self.chain.ainvoke({"question": query})
             expanded_queries = [q.strip() for q in response.content.split('\n') if q.strip()]
             return [query] + expanded_queries[:2] 
         except Exception as e:
@@ -64,11 +72,8 @@ class BaseRetriever:
         self.embedding_model = settings.EMBEDDING_MODEL
         self.k = settings.RETRIEVAL_K
         
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=self.embedding_model,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
+        # BGE-M3 derrière le cache persistant, chargé une seule fois par worker via le registre
+        self.embeddings = resources.get(EMBEDDINGS_RESOURCE)
 
         if os.getenv("IS_TESTING") == "True":
             # Mode éphémère (RAM) pour GitHub Actions
@@ -77,24 +82,75 @@ class BaseRetriever:
             )
         else:
             # Ton mode normal pour ton PC ou Docker
-            CHROMA_PERSIST_DIR = "/app/chroma_db"
             self.vector_store = Chroma(
-                persist_directory=CHROMA_PERSIST_DIR,
+                persist_directory=settings.CHROMA_PERSIST_DIR,
                 embedding_function=self.embeddings
             )
-        
-        self.retriever = self.vector_store.as_retriever(search_kwargs={"k": self.k})
-
-    def retrieve_candidates(self, queries: List[str]) -> List[any]:
-        print(f"📚 [Phase 2: Recherche] Extraction ChromaDB (k={self.k}) pour {len(queries)} variations...")
-        all_docs = []
-        for q in queries:
-            docs = self.retriever.invoke(q)
-            all_docs.extend(docs)
-        
-        unique_docs = {doc.page_content: doc for doc in all_docs}.values()
-        print(f"   -> {len(unique_docs)} documents uniques trouvés.")
-        return list(unique_docs)
+
+        # Mode hybride : BM25 construit à l'ingestion + dense, fusionnés par RRF
+        self.hybrid = settings.HYBRID_RETRIEVAL
+        self.bm25_path = os.path.join(settings.CHROMA_PERSIST_DIR, BM25_INDEX_FILE)
+        self._bm25 = None
+        self._bm25_mtime = None
+        self._bm25_lock = threading.Lock()
+
+    def lexical_index(self) -> Optional[BM25Index]:
+        # Rechargé uniquement quand l'ingestion a réécrit le fichier
+        try:
+            mtime = os.path.getmtime(self.bm25_path)
+        except OSError:
+            return None
+        # Appelé depuis des threads : une seule relecture du JSON quand plusieurs requêtes arrivent ensemble
+        with self._bm25_lock:
+            if mtime != self._bm25_mtime:
+                print(f"🔤 [Initialisation] Chargement de l'index BM25 ({self.bm25_path})...")
+                self._bm25 = BM25Index.load(self.bm25_path)
+                self._bm25_mtime = mtime
+            return self._bm25
+
+    async def aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        # Un seul forward pass BGE-M3 pour toutes les variations au lieu d'un encodage par question
+        with track_stage("embedding", self.embedding_model):
+            return await asyncio.to_thread(self.embeddings.embed_documents, queries)
+
+    async def asearch_by_vectors(self, vectors: List[List[float]], where: Optional[dict] = None) -> List[List[any]]:
+        # Les recherches Chroma sont lancées en parallèle, une par vecteur ; le filtre `where`
+        # est évalué par Chroma, qui ne parcourt que les chunks du domaine demandé
+        with track_stage("vector_search", "chroma"):
+            return list(await asyncio.gather(*[
+                asyncio.to_thread(self.vector_store.similarity_search_by_vector, vector, k=self.k, filter=where)
+                for vector in vectors
+            ]))
+
+    @staticmethod
+    def deduplicate(docs: List[any]) -> List[any]:
+        return list({doc.page_content: doc for doc in docs}.values())
+
+    async def aretrieve_candidates(
+        self, queries: List[str], query_vector: Optional[List[float]] = None, where: Optional[dict] = None
+    ) -> List[any]:
+        with track_stage("retrieval", self.embedding_model):
+            print(f"📚 [Phase 2: Recherche] Extraction ChromaDB (k={self.k}) pour {len(queries)} variations...")
+            if query_vector is not None:
+                # L'embedding de la question originale (queries[0]) est déjà calculé par le pipeline
+                vectors = [query_vector] + (await self.aembed_queries(queries[1:]) if len(queries) > 1 else [])
+            else:
+                vectors = await self.aembed_queries(queries)
+            rankings = await self.asearch_by_vectors(vectors, where)
+
+            # Rechargement de l'index et scoring BM25 hors de la boucle d'événements
+            bm25 = await asyncio.to_thread(self.lexical_index) if self.hybrid else None
+            if bm25 is not None:
+                # Noms de médicaments, doses, acronymes : le BM25 rattrape ce que le dense classe mal
+                with track_stage("lexical_search", "bm25"):
+                    rankings += await asyncio.gather(*(
+                        asyncio.to_thread(bm25.search, q, self.k, where) for q in queries
+                    ))
+                unique_docs = reciprocal_rank_fusion(rankings)
+            else:
+                unique_docs = self.deduplicate([doc for docs in rankings for doc in docs])
+            print(f"   -> {len(unique_docs)} documents uniques trouvés.")
+            return unique_docs
 
 class MedicalRetriever:
     def __init__(self):
@@ -105,25 +161,74 @@ class MedicalRetriever:
         self.rerank_model = settings.RERANK_MODEL
         self.top_n = settings.RERANK_TOP_N
         
-        print(f"🎯 [Initialisation] Chargement du Reranker Cohere ({self.rerank_model})...")
-        self.reranker = CohereRerank(
-            cohere_api_key=settings.COHERE_API_KEY,
-            model=self.rerank_model,
-            top_n=self.top_n
-        )
+        # Expansion LLM optionnelle (souvent superflue en mode hybride)
+        self.expansion_enabled = settings.QUERY_EXPANSION
 
-    def get_relevant_documents(self, query: str):
-        queries = self.expander.expand(query)
-        candidates = self.vector_search.retrieve_candidates(queries)
-        print(f"⚖️ [Phase 3: Reranking] Tri par Cohere (top_n={self.top_n})...")
-        return self.reranker.compress_documents(documents=candidates, query=query)
+        # Recherche spéculative : la question originale est cherchée pendant l'expansion
+        self.speculative = settings.SPECULATIVE_RETRIEVAL
+        self.expansion_timeout = settings.EXPANSION_TIMEOUT
+
+        # Cohere ("rerank-*") ou cross-encoder local selon settings.RERANK_MODEL
+        self.reranker = build_reranker(self.rerank_model, self.top_n)
+
+    async def aget_relevant_documents(
+        self, query: str, query_vector: Optional[List[float]] = None, where: Optional[dict] = None
+    ):
+        candidates = await self.aget_candidates(query, query_vector, where)
+        if where and not candidates:
+            # Collection ingérée avant l'ajout de la métadonnée "domain" : recherche sur toute la base
+            print(f"⚠️ Aucun chunk pour le filtre {where} : recherche sans filtre.")
+            candidates = await self.aget_candidates(query, query_vector)
+        RAG_CANDIDATES.observe(len(candidates))
+        print(f"⚖️ [Phase 3: Reranking] Tri par {self.rerank_model} (top_n={self.top_n})...")
+        with track_stage("rerank", self.rerank_model):
+            return await self.reranker.acompress_documents(documents=candidates, query=query)
     
-    def log_params(self):
-        """Logs real, non-hardcoded parameters used during this execution"""
-        mlflow.log_params({
+    async def aget_candidates(
+        self, query: str, query_vector: Optional[List[float]] = None, where: Optional[dict] = None
+    ) -> List[any]:
+        if not self.expansion_enabled:
+            return await self.vector_search.aretrieve_candidates([query], query_vector, where)
+        if self.speculative:
+            return await self.aspeculative_candidates(query, query_vector, where)
+        queries = await self.expander.aexpand(query)
+        return await self.vector_search.aretrieve_candidates(queries, query_vector, where)
+
+    async def aspeculative_candidates(
+        self, query: str, query_vector: Optional[List[float]] = None, where: Optional[dict] = None
+    ) -> List[any]:
+        # La question originale est toujours la première variation : sa recherche démarre tout de suite
+        original_search = asyncio.create_task(self.vector_search.aretrieve_candidates([query], query_vector, where))
+        try:
+            queries = await asyncio.wait_for(self.expander.aexpand(query), timeout=self.expansion_timeout)
+        except asyncio.TimeoutError:
+            print(f"⏱️ Expansion > {self.expansion_timeout}s : poursuite avec la question originale.")
+            queries = [query]
+
+        variants = queries[1:]
+        if not variants:
+            return await original_search
+
+        original_docs, expanded_docs = await asyncio.gather(
+            original_search,
+            self.vector_search.aretrieve_candidates(variants, where=where)
+        )
+        return self.vector_search.deduplicate(original_docs + expanded_docs)
+
+    def get_params(self):
+        """Real, non-hardcoded parameters used during this execution"""
+        return {
             "expansion_model": self.expander.model_name,
             "embedding_model": self.vector_search.embedding_model,
             "retrieval_k": self.vector_search.k,
+            "hybrid_retrieval": self.vector_search.hybrid,
+            "query_expansion": self.expansion_enabled,
             "rerank_model": self.rerank_model,
-            "rerank_top_n": self.top_n
-        })
\ No newline at end of file
+            "rerank_top_n": self.top_n,
+            "speculative_retrieval": self.speculative,
+            "expansion_timeout": self.expansion_timeout
+        }
+
+    def log_params(self):
+        """Logs the parameters to the active MLflow run"""
+        mlflow.log_params(self.get_params())
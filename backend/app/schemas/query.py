@@ -1,10 +1,22 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
+from app.rag.domains import canonical_domain
 
 class QueryBase(BaseModel):
     query_text: str
 
+class QueryRequest(QueryBase):
+    # Filtre optionnel sur le service (PÉDIATRIE, DENTAIRE, MÉDECINE, URGENCE)
+    service: Optional[str] = None
+
+    @field_validator("service")
+    @classmethod
+    def validate_service(cls, value: Optional[str]) -> Optional[str]:
+        if value and canonical_domain(value) is None:
+            raise ValueError(f"Service inconnu : {value}")
+        return value or None
+
 class QueryCreate(QueryBase):
     response_text: str
     user_id: int
@@ -15,4 +27,26 @@ class QueryResponse(QueryBase):
     created_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class QuerySummary(QueryBase):
+    # Entrée d'historique sans la réponse complète
+    id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class QuerySearchHit(QuerySummary):
+    rank: float
+    # Extraits avec les termes trouvés en **gras**
+    query_snippet: str
+    response_snippet: str
+
+class QuerySearchPage(BaseModel):
+    items: List[QuerySearchHit]
+    next_offset: Optional[int] = None
+
+class QueryHistoryPage(BaseModel):
+    items: List[QuerySummary]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,378 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, List, Optional, Sequence
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.documents import BaseDocumentCompressor, Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Benchmark de latence/débit hors ligne : MedicalPipeline complet derrière l'API FastAPI,
+# avec une collection Chroma de fixtures et des backends simulés (expansion, embeddings,
+# reranker, génération) à latence configurable. Aucun appel Groq/Cohere/HuggingFace.
+
+FIXTURE_CHUNKS = [
+    ("PÉDIATRIE", "Fièvre", "Fièvre de l'enfant : paracétamol 15 mg/kg toutes les 6 heures, sans dépasser 60 mg/kg/jour. Référer SAMU si purpura ou troubles de conscience."),
+    ("PÉDIATRIE", "Déshydratation", "Gastro-entérite aiguë : solution de réhydratation orale 50 à 100 ml/kg sur 4 heures. Hospitaliser si perte de poids supérieure à 10 %."),
+    ("URGENCE", "Anaphylaxie", "Choc anaphylactique : adrénaline IM 0,01 mg/kg (maximum 0,5 mg) face antérolatérale de la cuisse, à répéter après 5 minutes. Urgence vitale."),
+    ("URGENCE", "Douleur thoracique", "Douleur thoracique suspecte de SCA : ECG 12 dérivations en moins de 10 minutes, aspirine 250 mg IV ou 300 mg per os. Référer SAMU."),
+    ("URGENCE", "Hypoglycémie", "Hypoglycémie sévère : glucosé 30 % 50 ml IV ou glucagon 1 mg IM si pas d'abord veineux, contrôle glycémique à 15 minutes."),
+    ("DENTAIRE", "Abcès", "Abcès dentaire : drainage, amoxicilline 1 g trois fois par jour pendant 7 jours ; clindamycine en cas d'allergie aux pénicillines."),
+    ("DENTAIRE", "Hémorragie", "Hémorragie post-extractionnelle : compression 20 minutes, acide tranexamique local, sutures. Avis spécialisé urgent si anticoagulants."),
+    ("MÉDECINE GÉNÉRALE", "Hypertension", "Poussée hypertensive sans signe de gravité : repos 30 minutes puis nouvelle mesure ; pas de baisse tensionnelle brutale."),
+]
+
+DEFAULT_QUESTIONS = [
+    "Quelle dose de paracétamol pour une fièvre chez l'enfant ?",
+    "Conduite à tenir devant un choc anaphylactique ?",
+    "Comment réhydrater un enfant avec une gastro-entérite ?",
+    "Que faire devant une douleur thoracique ?",
+    "Traitement d'une hypoglycémie sévère ?",
+    "Quel antibiotique pour un abcès dentaire ?",
+    "Saignement après extraction dentaire chez un patient sous anticoagulants ?",
+    "Prise en charge d'une poussée hypertensive ?",
+]
+
+class SimulatedEmbeddings(Embeddings):
+    """Deterministic hash-based vectors with a fixed per-call latency, standing in for BGE-M3."""
+
+    def __init__(self, size: int = 64, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+
+    def _vector(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        values = [(digest[i % len(digest)] + i) % 251 / 125.0 - 1.0 for i in range(self.size)]
+        norm = sum(v * v for v in values) ** 0.5 or 1.0
+        return [v / norm for v in values]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Un forward pass par lot, comme BGE-M3 sur embed_documents
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+class SimulatedChatModel(BaseChatModel):
+    """Chat model returning a fixed answer after a simulated network latency, token by token when streamed."""
+
+    response: str
+    latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated-chat"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency + self.token_latency * len(self.response.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency + self.token_latency * len(self.response.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    async def _astream(self, messages: List[BaseMessage], stop=None, run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any):
+        # Latence avant le premier token, puis un délai par mot
+        await asyncio.sleep(self.latency)
+        for word in self.response.split(" "):
+            await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+class SimulatedReranker(BaseDocumentCompressor):
+    """Orders candidates by word overlap with the question after a simulated API latency."""
+
+    top_n: int = 3
+    latency: float = 0.0
+
+    def _rank(self, documents: Sequence[Document], query: str) -> List[Document]:
+        words = set(query.lower().split())
+        scored = sorted(documents, key=lambda doc: len(words & set(doc.page_content.lower().split())), reverse=True)
+        return list(scored[:self.top_n])
+
+    def compress_documents(self, documents: Sequence[Document], query: str, callbacks=None) -> Sequence[Document]:
+        time.sleep(self.latency)
+        return self._rank(documents, query)
+
+    async def acompress_documents(self, documents: Sequence[Document], query: str, callbacks=None) -> Sequence[Document]:
+        await asyncio.sleep(self.latency)
+        return self._rank(documents, query)
+
+class NullExporter:
+    # Le benchmark mesure le chemin de la requête, pas l'export MLflow
+    def submit(self, run_name: str, params: dict, metrics: dict):
+        pass
+
+    def shutdown(self, timeout: float = 10.0):
+        pass
+
+def fixture_documents(size: int) -> List[Document]:
+    from app.rag.domains import DEFAULT_DOMAIN, canonical_domain
+
+    # Variantes déterministes des chunks de base pour approcher la taille de la vraie collection,
+    # au format de l'ingestion : préfixe parsé par ContextPacker et métadonnée "domain" filtrable
+    docs = []
+    for i in range(size):
+        service, section, text = FIXTURE_CHUNKS[i % len(FIXTURE_CHUNKS)]
+        variant = i // len(FIXTURE_CHUNKS)
+        content = f"DOMAINE: {service}\nSUJET: {section}\n---\n{text}" + (f" (variante {variant})" if variant else "")
+        metadata = {
+            "source": "fixture.pdf",
+            "service": service,
+            "domain": canonical_domain(service) or DEFAULT_DOMAIN,
+            "section": section
+        }
+        docs.append(Document(page_content=content, metadata=metadata))
+    return docs
+
+def percentile(values: List[float], q: float) -> float:
+    # Interpolation linéaire entre les deux rangs encadrants
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = q * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(latencies: List[float], errors: int, elapsed: float, first_tokens: Optional[List[float]] = None) -> dict:
+    summary = {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "qps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency_mean_ms": 1000 * statistics.mean(latencies) if latencies else 0.0,
+        "latency_p50_ms": 1000 * percentile(latencies, 0.50),
+        "latency_p95_ms": 1000 * percentile(latencies, 0.95),
+        "latency_p99_ms": 1000 * percentile(latencies, 0.99),
+    }
+    if first_tokens:
+        summary["first_token_p50_ms"] = 1000 * percentile(first_tokens, 0.50)
+        summary["first_token_p95_ms"] = 1000 * percentile(first_tokens, 0.95)
+    return summary
+
+def stage_snapshot() -> dict:
+    # Sommes/compteurs cumulés de rag_stage_latency_seconds, différenciés entre deux paliers
+    from app.rag.metrics import RAG_STAGE_LATENCY
+    snapshot = {}
+    for family in RAG_STAGE_LATENCY.collect():
+        for sample in family.samples:
+            if sample.name.endswith("_sum") or sample.name.endswith("_count"):
+                kind = "sum" if sample.name.endswith("_sum") else "count"
+                snapshot.setdefault(sample.labels["stage"], {"sum": 0.0, "count": 0.0})[kind] += sample.value
+    return snapshot
+
+def stage_means(before: dict, after: dict) -> dict:
+    means = {}
+    for stage, values in after.items():
+        previous = before.get(stage, {"sum": 0.0, "count": 0.0})
+        count = values["count"] - previous["count"]
+        if count > 0:
+            means[stage] = 1000 * (values["sum"] - previous["sum"]) / count
+    return means
+
+def compare_reports(baseline: dict, report: dict, max_regression: float) -> List[str]:
+    """Returns one message per concurrency level whose p95 latency or QPS regressed beyond the tolerance."""
+    regressions = []
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in report["levels"]:
+        reference = previous.get(level["concurrency"])
+        if reference is None:
+            continue
+        if level["latency_p95_ms"] > reference["latency_p95_ms"] * (1 + max_regression):
+            regressions.append(
+                f"concurrence {level['concurrency']} : p95 {level['latency_p95_ms']:.1f} ms "
+                f"(référence {reference['latency_p95_ms']:.1f} ms)"
+            )
+        if level["qps"] < reference["qps"] * (1 - max_regression):
+            regressions.append(
+                f"concurrence {level['concurrency']} : {level['qps']:.2f} req/s "
+                f"(référence {reference['qps']:.2f} req/s)"
+            )
+    return regressions
+
+def build_app(args):
+    """Imports the FastAPI app on a throwaway SQLite database, then swaps every external backend for a simulated one."""
+    workdir = tempfile.mkdtemp(prefix="cliniq_bench_")
+    # Avant tout import de app.* : les settings et le moteur SQLAlchemy lisent ces variables
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["IS_TESTING"] = "True"
+    for key in ("SECRET_KEY", "COHERE_API_KEY", "GOOGLE_API_KEY", "GROQ_API_KEY"):
+        os.environ.setdefault(key, "benchmark")
+
+    from langchain_community.vectorstores import Chroma
+    from app.core.resources import resources
+    from app.main import app
+    from app.rag.embeddings import EMBEDDINGS_RESOURCE
+    from app.services.query_service import query_service
+
+    # Installé avant la construction du pipeline : BGE-M3 n'est jamais chargé
+    embeddings = SimulatedEmbeddings(latency=args.embedding_latency)
+    resources.provide(EMBEDDINGS_RESOURCE, embeddings)
+    pipeline = query_service.pipeline
+    retriever = pipeline.retriever
+    query_service.telemetry = NullExporter()
+
+    retriever.vector_search.vector_store = Chroma(collection_name="bench_fixture", embedding_function=embeddings)
+    retriever.vector_search.vector_store.add_documents(fixture_documents(args.fixture_size))
+
+    retriever.expander.model_name = "simulated-expander"
+    retriever.expander.chain = retriever.expander.prompt | SimulatedChatModel(
+        response="Reformulation clinique 1\nReformulation clinique 2", latency=args.expansion_latency
+    )
+    retriever.expansion_enabled = args.expansion
+    retriever.rerank_model = "simulated-reranker"
+    retriever.reranker = SimulatedReranker(top_n=retriever.top_n, latency=args.rerank_latency)
+
+    generator = pipeline.generator
+    generator.model_name = "simulated-generator"
+    generator.chain = generator.prompt | SimulatedChatModel(
+        response="**Synthèse Clinique :** réponse simulée pour le benchmark. " * 8,
+        latency=args.generation_latency,
+        token_latency=args.token_latency
+    )
+    if not args.cache:
+        # Sans cache, chaque requête traverse tout le pipeline
+        pipeline.cache = None
+    return app
+
+async def authenticate(client) -> dict:
+    await client.post("/auth/signup", json={"username": "bench", "email": "bench@cliniq.fr", "password": "bench-password"})
+    response = await client.post("/auth/login", data={"username": "bench", "password": "bench-password"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def timed_request(client, headers: dict, question: str, stream: bool):
+    """Returns (total latency, time to first token or None); raises on HTTP or pipeline errors."""
+    start = time.perf_counter()
+    if not stream:
+        response = await client.post("/chat/query", json={"query_text": question}, headers=headers)
+        response.raise_for_status()
+        return time.perf_counter() - start, None
+
+    first_token = None
+    async with client.stream("POST", "/chat/query/stream", json={"query_text": question}, headers=headers) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line == "event: token" and first_token is None:
+                first_token = time.perf_counter() - start
+            elif line == "event: error":
+                raise RuntimeError("événement SSE 'error'")
+    return time.perf_counter() - start, first_token
+
+async def run_level(client, headers: dict, questions: List[str], concurrency: int, total: int, stream: bool) -> dict:
+    latencies, first_tokens = [], []
+    errors = 0
+    pending = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in pending:
+            try:
+                latency, first_token = await timed_request(client, headers, questions[i % len(questions)], stream)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(latency)
+            if first_token is not None:
+                first_tokens.append(first_token)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(latencies, errors, time.perf_counter() - start, first_tokens)
+
+async def run_benchmark(app, questions: List[str], concurrency_levels: List[int], total: int, warmup: int, stream: bool) -> List[dict]:
+    import httpx
+    import uvicorn
+    # Vrai serveur HTTP local : httpx.ASGITransport met les réponses en tampon et fausserait le premier token SSE
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", lifespan="off"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    try:
+        limits = httpx.Limits(max_connections=max(concurrency_levels), max_keepalive_connections=max(concurrency_levels))
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120, limits=limits) as client:
+            headers = await authenticate(client)
+            # Échauffement hors mesure : première requête Chroma, connexions HTTP, etc.
+            for i in range(warmup):
+                await timed_request(client, headers, questions[i % len(questions)], stream)
+
+            levels = []
+            for concurrency in concurrency_levels:
+                print(f"⏱️ Palier concurrence={concurrency} ({total} requêtes)...")
+                before = stage_snapshot()
+                level = await run_level(client, headers, questions, concurrency, total, stream)
+                levels.append({"concurrency": concurrency, **level, "stage_mean_ms": stage_means(before, stage_snapshot())})
+            return levels
+    finally:
+        server.should_exit = True
+        await serve_task
+
+def load_questions(path: Optional[str]) -> List[str]:
+    if not path:
+        return DEFAULT_QUESTIONS
+    with open(path, 'r', encoding='utf-8') as f:
+        return [case['question'] for case in json.load(f)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmark of the RAG API with simulated LLM backends.")
+    parser.add_argument("--questions", default=None, help="JSON file of test cases (e.g. data/test_cases.json); built-in questions by default")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=4)
+    parser.add_argument("--stream", action="store_true", help="Benchmark /chat/query/stream and report time to first token")
+    parser.add_argument("--fixture-size", type=int, default=2000, help="Number of chunks in the fixture Chroma collection")
+    parser.add_argument("--expansion", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--cache", action="store_true", help="Keep the answer cache enabled (disabled by default)")
+    parser.add_argument("--expansion-latency", type=float, default=0.4, help="Simulated expansion LLM latency (s)")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="Simulated embedding latency per batch (s)")
+    parser.add_argument("--rerank-latency", type=float, default=0.15, help="Simulated reranker latency (s)")
+    parser.add_argument("--generation-latency", type=float, default=0.5, help="Simulated generation latency before the first token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Simulated delay per generated word (s)")
+    parser.add_argument("--output", default="data/pipeline_benchmark.json")
+    parser.add_argument("--baseline", default=None, help="Previous report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Tolerated p95/QPS regression vs. the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    app = build_app(args)
+    questions = load_questions(args.questions)
+    levels = asyncio.run(run_benchmark(app, questions, args.concurrency, args.requests, args.warmup, args.stream))
+
+    report = {
+        "endpoint": "/chat/query/stream" if args.stream else "/chat/query",
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "levels": levels
+    }
+    for level in levels:
+        print(
+            f"\n✅ concurrence={level['concurrency']} : {level['qps']:.2f} req/s, "
+            f"p50={level['latency_p50_ms']:.1f} ms, p95={level['latency_p95_ms']:.1f} ms, "
+            f"p99={level['latency_p99_ms']:.1f} ms, erreurs={level['errors']}"
+        )
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n📄 Rapport écrit dans {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_reports(json.load(f), report, args.max_regression)
+        for message in regressions:
+            print(f"❌ Régression : {message}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import time
+from app.core.config import settings
+from app.rag.cache import normalize_question
+from app.rag.reranker import build_reranker
+from app.rag.retriever import BaseRetriever
+
+# Compare les rerankers hors ligne sur data/test_cases.json : même pool de candidats Chroma,
+# latence par requête et NDCG calculé à partir de la réponse attendue.
+
+def content_tokens(text: str) -> set:
+    return {token for token in normalize_question(text).split() if len(token) > 3}
+
+def relevance(candidate: str, expected_output: str) -> float:
+    # Pertinence graduée : part des mots de la réponse attendue présents dans le chunk
+    expected = content_tokens(expected_output)
+    if not expected:
+        return 0.0
+    return len(expected & content_tokens(candidate)) / len(expected)
+
+def ndcg_at_k(ranked_relevances, all_relevances, k: int) -> float:
+    dcg = sum(rel / math.log2(i + 2) for i, rel in enumerate(ranked_relevances[:k]))
+    ideal = sorted(all_relevances, reverse=True)[:k]
+    idcg = sum(rel / math.log2(i + 2) for i, rel in enumerate(ideal))
+    return dcg / idcg if idcg > 0 else 0.0
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def benchmark_reranker(reranker, pools, top_n: int):
+    # Premier appel hors mesure : chargement des poids / ouverture de la connexion
+    question, candidates, _ = pools[0]
+    reranker.compress_documents(candidates, question)
+
+    latencies, ndcgs = [], []
+    for question, candidates, rels in pools:
+        start = time.perf_counter()
+        ranked = reranker.compress_documents(candidates, question)
+        latencies.append(time.perf_counter() - start)
+
+        ranked_rels = [rels[doc.page_content] for doc in ranked]
+        ndcgs.append(ndcg_at_k(ranked_rels, list(rels.values()), top_n))
+
+    return {
+        "latency_mean_ms": 1000 * statistics.mean(latencies),
+        "latency_p50_ms": 1000 * percentile(latencies, 0.50),
+        "latency_p95_ms": 1000 * percentile(latencies, 0.95),
+        f"ndcg@{top_n}": statistics.mean(ndcgs)
+    }
+
+async def build_candidate_pools(test_cases, candidates_k: int):
+    retriever = BaseRetriever()
+    retriever.k = candidates_k
+    pools = []
+    for case in test_cases:
+        candidates = await retriever.aretrieve_candidates([case['question']])
+        if not candidates:
+            continue
+        rels = {doc.page_content: relevance(doc.page_content, str(case['expected_output'])) for doc in candidates}
+        pools.append((case['question'], candidates, rels))
+    return pools
+
+def run_benchmark(test_cases_path: str, models, candidates_k: int, top_n: int):
+    with open(test_cases_path, 'r', encoding='utf-8') as f:
+        test_cases = json.load(f)
+
+    print(f"📚 Construction des pools de candidats (k={candidates_k}) pour {len(test_cases)} cas...")
+    pools = asyncio.run(build_candidate_pools(test_cases, candidates_k))
+
+    report = {"cases": len(pools), "candidates_k": candidates_k, "top_n": top_n, "rerankers": {}}
+    for model_name in models:
+        print(f"⚖️ Benchmark du reranker {model_name}...")
+        reranker = build_reranker(model_name, top_n)
+        report["rerankers"][model_name] = benchmark_reranker(reranker, pools, top_n)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency/NDCG comparison of rerankers on data/test_cases.json.")
+    parser.add_argument("--test-cases", default="data/test_cases.json")
+    parser.add_argument(
+        "--models", nargs="+",
+        default=[settings.RERANK_MODEL, "BAAI/bge-reranker-v2-m3"],
+        help="Cohere ('rerank-*') and/or HuggingFace cross-encoder model names"
+    )
+    parser.add_argument("--candidates", type=int, default=15, help="Chroma candidates reranked per question")
+    parser.add_argument("--top-n", type=int, default=settings.RERANK_TOP_N)
+    parser.add_argument("--output", default="data/rerank_benchmark.json")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.test_cases, args.models, args.candidates, args.top_n)
+
+    for model_name, metrics in report["rerankers"].items():
+        print(f"\n✅ {model_name}")
+        for name, value in metrics.items():
+            print(f"   {name}: {value:.3f}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n📄 Rapport écrit dans {args.output}")
+
+if __name__ == "__main__":
+    main()
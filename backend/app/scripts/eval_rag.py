@@ -1,8 +1,12 @@
-import os
+import argparse
+import asyncio
+import hashlib
 import json
+import os
 import time
 import re
-import mlflow
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
 from deepeval.metrics import (
     FaithfulnessMetric, 
     AnswerRelevancyMetric, 
@@ -13,11 +17,20 @@ from deepeval.test_case import LLMTestCase
 from deepeval.models.base_model import DeepEvalBaseLLM
 from langchain_groq import ChatGroq
 from app.rag.pipeline import MedicalPipeline
+from app.rag.domains import domain_filter
+from app.rag.metrics import estimate_tokens
 from app.core.config import settings
+from app.core.rate_limit import RateLimiter, call_with_backoff, is_rate_limited
+
+JSON_INSTRUCTION = "You are a specialized JSON generator. Respond ONLY with a valid JSON object. No prose."
+# Réponse attendue de l'expansion (2 reformulations) : sert au budget TPM d'un appel au pipeline
+EXPANSION_COMPLETION_TOKENS = 128
+# Réponse clinique maximale attendue du générateur : budget TPM d'une génération
+GENERATION_COMPLETION_TOKENS = 1024
 
 # --- Wrapper DeepEval pour Groq ---
 class GroqDeepEvalWrapper(DeepEvalBaseLLM):
-    def __init__(self, model_name):
+    def __init__(self, model_name, limiter: RateLimiter = None, completion_tokens: int = 512):
         self.model = ChatGroq(
             groq_api_key=settings.GROQ_API_KEY,
             model_name=model_name,
@@ -25,6 +38,9 @@ class GroqDeepEvalWrapper(DeepEvalBaseLLM):
             model_kwargs={"response_format": {"type": "json_object"}}
         )
         self.model_name = model_name
+        # Quota Groq partagé par tous les juges qui tournent en parallèle
+        self.limiter = limiter
+        self.completion_tokens = completion_tokens
 
     def load_model(self):
         return self.model
@@ -37,109 +53,242 @@ class GroqDeepEvalWrapper(DeepEvalBaseLLM):
         return text
 
     def generate(self, prompt: str) -> str:
-        # Pause de sécurité avant chaque appel interne de métrique
-        time.sleep(2) 
-        instruction = "You are a specialized JSON generator. Respond ONLY with a valid JSON object. No prose."
-        full_prompt = f"{instruction}\n\n{prompt}"
-        
-        for attempt in range(3):
+        # Chemin synchrone (metrics en async_mode=False) : backoff exponentiel sur 429, sans pause fixe
+        full_prompt = f"{JSON_INSTRUCTION}\n\n{prompt}"
+        for attempt in range(5):
             try:
                 content = self.model.invoke(full_prompt).content
                 return self._extract_json(content)
             except Exception as e:
-                if "429" in str(e):
-                    print(f"⏳ Rate limit atteint, attente 10s (essai {attempt+1})...")
-                    time.sleep(10)
-                else:
+                if not is_rate_limited(e) or attempt == 4:
                     raise e
-        return ""
+                print(f"⏳ Rate limit atteint, attente {2 ** (attempt + 1)}s (essai {attempt+1})...")
+                time.sleep(2 ** (attempt + 1))
 
     async def a_generate(self, prompt: str) -> str:
-        instruction = "You are a specialized JSON generator. Respond ONLY with a valid JSON object. No prose."
-        full_prompt = f"{instruction}\n\n{prompt}"
-        res = await self.model.ainvoke(full_prompt)
+        full_prompt = f"{JSON_INSTRUCTION}\n\n{prompt}"
+        # Budget TPM : prompt estimé + réponse maximale attendue
+        res = await call_with_backoff(
+            lambda: self.model.ainvoke(full_prompt),
+            limiter=self.limiter,
+            tokens=estimate_tokens(full_prompt) + self.completion_tokens
+        )
         return self._extract_json(res.content)
 
     def get_model_name(self):
         return self.model_name
 
-def evaluate_project():
+
+class PipelineOutputCache:
+    """Persists pipeline outputs per test case so metric reruns don't re-query the RAG."""
+
+    def __init__(self, path: str, pipeline_params: dict):
+        self.path = path
+        # Toute modification de la config RAG (modèles, k, top_n...) invalide les sorties en cache
+        self.fingerprint = json.dumps(pipeline_params, sort_keys=True, default=str)
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def key(self, question: str) -> str:
+        return hashlib.sha256(f"{self.fingerprint}|{question}".encode("utf-8")).hexdigest()
+
+    def get(self, question: str):
+        return self.entries.get(self.key(question))
+
+    def put(self, question: str, output: dict):
+        self.entries[self.key(question)] = output
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+def build_output(result: dict) -> dict:
+    # Nettoyage de la réponse
+    raw_answer = result['answer']
+    actual_output = raw_answer[0].get('text', str(raw_answer)) if isinstance(raw_answer, list) and len(raw_answer) > 0 else str(raw_answer)
+
+    # Nettoyage du contexte
+    retrieval_context = [
+        doc.get('page_content', str(doc)) if isinstance(doc, dict) else str(doc)
+        for doc in result['sources']
+    ]
+    return {"actual_output": actual_output, "retrieval_context": retrieval_context}
+
+def build_metrics(eval_llm):
+    # Une instance par cas : les métriques DeepEval stockent score et raison sur l'objet
+    return {
+        "faithfulness": FaithfulnessMetric(threshold=0.7, model=eval_llm, async_mode=True),
+        "answer_relevance": AnswerRelevancyMetric(threshold=0.7, model=eval_llm, async_mode=True),
+        "contextual_precision": ContextualPrecisionMetric(threshold=0.7, model=eval_llm, async_mode=True),
+        "contextual_recall": ContextualRecallMetric(threshold=0.7, model=eval_llm, async_mode=True),
+    }
+
+class EvaluationRunner:
+    """Evaluates all test cases concurrently: expansion shares the judge's Groq limiter, generation has its own."""
+
+    def __init__(
+        self, pipeline, eval_llm, output_cache: PipelineOutputCache, concurrency: int, experiment_name: str,
+        generation_limiter: RateLimiter = None
+    ):
+        self.pipeline = pipeline
+        self.eval_llm = eval_llm
+        # L'expansion du pipeline consomme le même quota llama-3.1-8b-instant que le juge
+        self.limiter = eval_llm.limiter
+        # La génération (llama-3.3-70b-versatile) a son propre quota Groq : un 429 ne bloque pas le juge
+        self.generation_limiter = generation_limiter
+        self.output_cache = output_cache
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.experiment_name = experiment_name
+        self.client = MlflowClient(tracking_uri=settings.MLFLOW_TRACKING_URI)
+        self.experiment_id = None
+
+    async def run(self, test_cases):
+        experiment = self.client.get_experiment_by_name(self.experiment_name)
+        self.experiment_id = experiment.experiment_id if experiment else self.client.create_experiment(self.experiment_name)
+        return await asyncio.gather(*[self.evaluate_case(i, case) for i, case in enumerate(test_cases)])
+
+    async def pipeline_output(self, question: str) -> dict:
+        cached = self.output_cache.get(question)
+        if cached is not None:
+            print(f"💾 Sortie du pipeline réutilisée : {question[:50]}...")
+            return cached
+        # Mêmes étapes que pipeline.asearch, mais chaque appel Groq passe par le limiter de son modèle
+        retriever = self.pipeline.retriever
+        where = domain_filter(self.pipeline.resolve_domain(question))
+        # L'expansion avale ses 429 (repli sur la question seule) : le quota est réservé avant l'appel
+        # plutôt que compté sur un retry qui n'arrivera pas
+        expansion = getattr(retriever, "expansion_enabled", False)
+        docs = await call_with_backoff(
+            lambda: retriever.aget_relevant_documents(question, None, where),
+            limiter=self.limiter if expansion else None,
+            tokens=self.expansion_tokens(question) if expansion else 1
+        )
+        # Un 429 de la génération ne rejoue que la génération, et ne met en pause que son limiter
+        answer = await call_with_backoff(
+            lambda: self.pipeline.generator.agenerate(question, docs),
+            limiter=self.generation_limiter,
+            tokens=self.generation_tokens(question, docs)
+        )
+        output = build_output({"answer": answer, "sources": [doc.metadata for doc in docs]})
+        self.output_cache.put(question, output)
+        return output
+
+    def expansion_tokens(self, question: str) -> int:
+        prompt = self.pipeline.retriever.expander.prompt.format(question=question)
+        return estimate_tokens(prompt) + EXPANSION_COMPLETION_TOKENS
+
+    def generation_tokens(self, question: str, docs) -> int:
+        generator = self.pipeline.generator
+        prompt = generator.prompt.format(context=generator.packer.pack(question, docs), question=question)
+        return estimate_tokens(prompt) + GENERATION_COMPLETION_TOKENS
+
+    async def evaluate_case(self, i: int, case: dict):
+        async with self.semaphore:
+            print(f"\n🔍 Évaluation Cas #{i+1} : {case['question'][:50]}...")
+            try:
+                output = await self.pipeline_output(case['question'])
+
+                # Création du Test Case complet
+                test_case = LLMTestCase(
+                    input=case['question'],
+                    actual_output=output['actual_output'],
+                    expected_output=str(case['expected_output']),
+                    retrieval_context=output['retrieval_context']
+                )
+
+                # Les 4 métriques sont jugées en parallèle, sous le contrôle du limiter
+                metrics = build_metrics(self.eval_llm)
+                await asyncio.gather(*[metric.a_measure(test_case, _show_indicator=False) for metric in metrics.values()])
+                scores = {name: metric.score for name, metric in metrics.items()}
+
+                await asyncio.to_thread(self.log_case, i, case, output, metrics)
+                print(f"✅ Scores Cas #{i+1}: Faith={scores['faithfulness']} | Rel={scores['answer_relevance']} | Prec={scores['contextual_precision']} | Rec={scores['contextual_recall']}")
+                return scores
+            except Exception as e:
+                print(f"❌ Erreur lors de l'évaluation du cas {i+1}: {str(e)}")
+                return None
+
+    def log_case(self, i: int, case: dict, output: dict, metrics: dict):
+        # Runs MLflow explicites (run_id) : le run actif global de mlflow ne supporte pas les cas concurrents
+        timestamp = int(time.time() * 1000)
+        run_id = self.client.create_run(self.experiment_id, run_name=f"Audit_Full_Case_{i+1}").info.run_id
+
+        # 1. Logger les paramètres et métriques (une métrique sans score, juge en échec, n'est pas loggée)
+        skipped = [name for name, metric in metrics.items() if metric.score is None]
+        if skipped:
+            print(f"⚠️ Cas #{i+1} : pas de score pour {', '.join(skipped)}")
+        self.client.log_batch(
+            run_id,
+            metrics=[Metric(name, float(metric.score), timestamp, 0) for name, metric in metrics.items() if metric.score is not None],
+            params=[Param("question", case['question'][:500])]
+        )
+
+        # 2. Logger les textes pour comparaison visuelle
+        self.client.log_text(run_id, output['actual_output'], "actual_response.txt")
+        self.client.log_text(run_id, str(case['expected_output']), "expected_response.txt")
+
+        # 3. Logger les raisons du juge
+        self.client.log_text(run_id, str(metrics['faithfulness'].reason), "debug/faithfulness_reason.txt")
+        self.client.log_text(run_id, str(metrics['answer_relevance'].reason), "debug/relevancy_reason.txt")
+
+        # 4. Logger le contexte utilisé
+        self.client.log_text(run_id, "\n---\n".join(output['retrieval_context']), "retrieval_context.txt")
+        self.client.set_terminated(run_id)
+
+def evaluate_project(
+    test_cases_path: str = 'data/test_cases.json',
+    concurrency: int = 4,
+    rpm: int = 30,
+    tpm: int = 6000,
+    generation_rpm: int = 30,
+    generation_tpm: int = 12000,
+    output_cache_path: str = 'data/cache/eval_outputs.json',
+    refresh: bool = False
+):
     pipeline = MedicalPipeline()
+    # Le cache de réponses servirait des sorties d'une config précédente : l'audit interroge le vrai pipeline
+    pipeline.cache = None
     # On reste sur le 8b pour éviter les saturations de quota du 70b
-    eval_llm = GroqDeepEvalWrapper(model_name="llama-3.1-8b-instant")
-    
-    with open('data/test_cases.json', 'r', encoding='utf-8') as f:
+    eval_llm = GroqDeepEvalWrapper(model_name="llama-3.1-8b-instant", limiter=RateLimiter(rpm=rpm, tpm=tpm))
+
+    with open(test_cases_path, 'r', encoding='utf-8') as f:
         test_cases = json.load(f)
 
-    mlflow.set_experiment("ProtoCare_DeepEval_Full_Audit")
-
-    # Initialisation de TOUTES les métriques demandées
-    faith_metric = FaithfulnessMetric(threshold=0.7, model=eval_llm)
-    relevancy_metric = AnswerRelevancyMetric(threshold=0.7, model=eval_llm)
-    precision_metric = ContextualPrecisionMetric(threshold=0.7, model=eval_llm)
-    recall_metric = ContextualRecallMetric(threshold=0.7, model=eval_llm)
-
-    print(f"📊 Début de l'audit complet sur {len(test_cases)} cas...")
-
-    for i, case in enumerate(test_cases):
-        print(f"\n🔍 Évaluation Cas #{i+1} : {case['question'][:50]}...")
-        
-        try:
-            # Exécution du pipeline (Gemini)
-            result = pipeline.search(case['question'])
-            
-            # Nettoyage de la réponse
-            raw_answer = result['answer']
-            actual_output = raw_answer[0].get('text', str(raw_answer)) if isinstance(raw_answer, list) and len(raw_answer) > 0 else str(raw_answer)
-
-            # Nettoyage du contexte
-            retrieval_context = [
-                doc.get('page_content', str(doc)) if isinstance(doc, dict) else str(doc)
-                for doc in result['sources']
-            ]
-            
-            # Création du Test Case complet
-            test_case = LLMTestCase(
-                input=case['question'],
-                actual_output=actual_output,
-                expected_output=str(case['expected_output']),
-                retrieval_context=retrieval_context
-            )
-
-            # Mesure des métriques
-            print("⚖️ Calcul des 4 métriques via Groq...")
-            faith_metric.measure(test_case)
-            relevancy_metric.measure(test_case)
-            precision_metric.measure(test_case)
-            recall_metric.measure(test_case)
-
-            with mlflow.start_run(run_name=f"Audit_Full_Case_{i+1}"):
-                # 1. Logger les paramètres et métriques
-                mlflow.log_param("question", case['question'])
-                mlflow.log_metric("faithfulness", faith_metric.score)
-                mlflow.log_metric("answer_relevance", relevancy_metric.score)
-                mlflow.log_metric("contextual_precision", precision_metric.score)
-                mlflow.log_metric("contextual_recall", recall_metric.score)
-                
-                # 2. Logger les textes pour comparaison visuelle
-                mlflow.log_text(actual_output, "actual_response.txt")
-                mlflow.log_text(str(case['expected_output']), "expected_response.txt")
-                
-                # 3. Logger les raisons du juge
-                mlflow.log_text(str(faith_metric.reason), "debug/faithfulness_reason.txt")
-                mlflow.log_text(str(relevancy_metric.reason), "debug/relevancy_reason.txt")
-                
-                # 4. Logger le contexte utilisé
-                mlflow.log_text("\n---\n".join(retrieval_context), "retrieval_context.txt")
-                
-                print(f"✅ Scores Cas #{i+1}: Faith={faith_metric.score} | Rel={relevancy_metric.score} | Prec={precision_metric.score} | Rec={recall_metric.score}")
-
-        except Exception as e:
-            print(f"❌ Erreur lors de l'évaluation du cas {i+1}: {str(e)}")
-
-        # Pause longue entre chaque cas pour réinitialiser le quota TPM de Groq
-        print("⏳ Pause de 15s pour le Rate Limit...")
-        time.sleep(15)
+    output_cache = PipelineOutputCache(
+        output_cache_path,
+        {**pipeline.retriever.get_params(), **pipeline.generator.get_params()}
+    )
+    if refresh:
+        output_cache.entries = {}
+
+    print(f"📊 Début de l'audit complet sur {len(test_cases)} cas (concurrence={concurrency}, {rpm} RPM / {tpm} TPM)...")
+    runner = EvaluationRunner(
+        pipeline, eval_llm, output_cache, concurrency, "ProtoCare_DeepEval_Full_Audit",
+        generation_limiter=RateLimiter(rpm=generation_rpm, tpm=generation_tpm)
+    )
+    results = asyncio.run(runner.run(test_cases))
+    print(f"\n🏁 Audit terminé : {sum(r is not None for r in results)}/{len(test_cases)} cas évalués.")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent DeepEval audit of the RAG pipeline, rate-limited to the Groq quotas.")
+    parser.add_argument("--test-cases", default="data/test_cases.json")
+    parser.add_argument("--concurrency", type=int, default=4, help="Test cases evaluated at the same time")
+    parser.add_argument("--rpm", type=int, default=30, help="Groq requests per minute for the judge model")
+    parser.add_argument("--tpm", type=int, default=6000, help="Groq tokens per minute for the judge model")
+    parser.add_argument("--generation-rpm", type=int, default=30, help="Groq requests per minute for the generator model")
+    parser.add_argument("--generation-tpm", type=int, default=12000, help="Groq tokens per minute for the generator model")
+    parser.add_argument("--output-cache", default="data/cache/eval_outputs.json")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached pipeline outputs and re-query the RAG")
+    args = parser.parse_args()
+
+    evaluate_project(
+        args.test_cases, args.concurrency, args.rpm, args.tpm,
+        args.generation_rpm, args.generation_tpm, args.output_cache, args.refresh
+    )
 
 if __name__ == "__main__":
-    evaluate_project()
\ No newline at end of file
+    main()
@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from typing import List
+import numpy as np
+from app.core.config import settings
+
+# Export ONNX (+ quantification int8 dynamique) de BGE-M3 pour EMBEDDING_BACKEND="onnx" / "onnx-int8",
+# et contrôle de parité : recouvrement top-k face au modèle fp32 sur les chunks déjà ingérés.
+#   python -m app.scripts.export_onnx export --output /app/data/models/bge-m3-onnx
+#   python -m app.scripts.export_onnx parity --backend onnx-int8
+
+def export_model(model, tokenizer, output_dir: str, opset: int = 17) -> str:
+    """Exports a transformers encoder to output_dir/model.onnx (last_hidden_state output) with its tokenizer."""
+    import torch
+
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, "model.onnx")
+    class LastHiddenState(torch.nn.Module):
+        # Arguments nommés : l'ordre positionnel de forward() change selon les versions de transformers
+        def __init__(self, encoder):
+            super().__init__()
+            self.encoder = encoder
+
+        def forward(self, input_ids, attention_mask):
+            return self.encoder(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    # eval() sur le wrapper : l'exporteur restaure le mode du module exporté, qui se propage à l'encodeur
+    wrapper = LastHiddenState(model).eval()
+    # Lot paddé de deux longueurs : le masque d'attention est tracé dans le cas général
+    dummy = tokenizer(["Fièvre de l'enfant : paracétamol 15 mg/kg toutes les 6 heures", "Choc anaphylactique"], padding=True, return_tensors="pt")
+    with torch.no_grad():
+        # Axes dynamiques : taille de lot et longueur de séquence libres à l'inférence
+        torch.onnx.export(
+            wrapper,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            model_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"}
+            },
+            opset_version=opset,
+            dynamo=False
+        )
+    tokenizer.save_pretrained(output_dir)
+    return model_path
+
+def quantize_model(output_dir: str) -> str:
+    # Quantification dynamique : poids en int8, activations quantifiées à la volée (aucun jeu de calibration)
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_path = os.path.join(output_dir, "model_quantized.onnx")
+    quantize_dynamic(
+        os.path.join(output_dir, "model.onnx"),
+        quantized_path,
+        weight_type=QuantType.QInt8,
+        use_external_data_format=False
+    )
+    return quantized_path
+
+def topk_indices(query_vectors: np.ndarray, chunk_vectors: np.ndarray, k: int) -> np.ndarray:
+    # Recherche exacte par produit scalaire (vecteurs normalisés) : même classement que Chroma en cosinus
+    scores = query_vectors @ chunk_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def topk_overlap(reference: np.ndarray, candidate: np.ndarray) -> List[float]:
+    k = reference.shape[1]
+    return [len(set(ref) & set(cand)) / k for ref, cand in zip(reference.tolist(), candidate.tolist())]
+
+def parity_report(reference_chunks, candidate_chunks, reference_queries, candidate_queries, k: int) -> dict:
+    """Compares the fp32 and optimized rankings of the same queries over the same chunks."""
+    reference_top = topk_indices(reference_queries, reference_chunks, k)
+    candidate_top = topk_indices(candidate_queries, candidate_chunks, k)
+    overlaps = topk_overlap(reference_top, candidate_top)
+    cosines = np.sum(reference_chunks * candidate_chunks, axis=1)
+    return {
+        "queries": len(reference_queries),
+        "chunks": len(reference_chunks),
+        f"overlap@{k}_mean": statistics.mean(overlaps),
+        f"overlap@{k}_min": min(overlaps),
+        "top1_agreement": float(np.mean(reference_top[:, 0] == candidate_top[:, 0])),
+        # Part des top-1 fp32 encore présents dans le top-k optimisé : le recall réellement perdu
+        f"top1_recall@{k}": float(np.mean([ref[0] in cand for ref, cand in zip(reference_top.tolist(), candidate_top.tolist())])),
+        "chunk_cosine_mean": float(np.mean(cosines)),
+        "chunk_cosine_min": float(np.min(cosines))
+    }
+
+def normalized(vectors) -> np.ndarray:
+    array = np.asarray(vectors, dtype=np.float32)
+    return array / np.linalg.norm(array, axis=1, keepdims=True)
+
+def load_chunks(max_chunks: int):
+    """Returns the ingested chunk texts, their stored vectors and the embedding model key that produced them."""
+    from langchain_community.vectorstores import Chroma
+    store = Chroma(persist_directory=settings.CHROMA_PERSIST_DIR)
+    stored = store.get(include=["documents", "embeddings", "metadatas"])
+    rows = list(zip(stored["documents"], stored["embeddings"], stored["metadatas"]))
+    if len(rows) > max_chunks:
+        rows = random.Random(0).sample(rows, max_chunks)
+    # Chunks ingérés avant la métadonnée "embedding_model", ou collection mixte : modèle inconnu (None)
+    models = {(metadata or {}).get("embedding_model") for _, _, metadata in rows}
+    stored_model = models.pop() if len(models) == 1 else None
+    return [text for text, _, _ in rows], normalized([vector for _, vector, _ in rows]), stored_model
+
+def load_queries(test_cases_path: str, chunks: List[str], sample_chunks: int) -> List[str]:
+    queries = []
+    if os.path.exists(test_cases_path):
+        with open(test_cases_path, 'r', encoding='utf-8') as f:
+            queries = [case['question'] for case in json.load(f)]
+    # Débuts de chunks en requêtes supplémentaires : couvre les services absents des cas de test
+    sampled = random.Random(1).sample(chunks, min(sample_chunks, len(chunks)))
+    return queries + [chunk[:200] for chunk in sampled]
+
+def run_export(args):
+    from transformers import AutoModel, AutoTokenizer
+
+    print(f"📦 Chargement de {args.model} (fp32)...")
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModel.from_pretrained(args.model)
+
+    print(f"🔧 Export ONNX vers {args.output}...")
+    export_model(model, tokenizer, args.output, args.opset)
+
+    if not args.no_quantize:
+        print("🗜️ Quantification int8 dynamique...")
+        quantized_path = quantize_model(args.output)
+        print(f"   -> model_quantized.onnx : {os.path.getsize(quantized_path) / (1024 * 1024):.0f} Mo")
+    print(f"✅ Export terminé. Activer avec EMBEDDING_BACKEND=onnx-int8 et EMBEDDING_ONNX_PATH={args.output}")
+
+def run_parity(args):
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    from app.rag.embeddings import OnnxEmbeddings, embedding_model_key
+
+    chunks, stored_chunks, stored_model = load_chunks(args.max_chunks)
+    if not chunks:
+        raise SystemExit("❌ Collection Chroma vide : lancer l'ingestion avant le contrôle de parité.")
+    queries = load_queries(args.test_cases, chunks, args.sample_queries)
+    print(f"📚 {len(chunks)} chunks ingérés ({stored_model or 'modèle inconnu'}), {len(queries)} requêtes de contrôle.")
+
+    reference_model = HuggingFaceEmbeddings(
+        model_name=settings.EMBEDDING_MODEL,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+    candidate_model = OnnxEmbeddings(args.onnx_path, quantized=args.backend == "onnx-int8")
+
+    start = time.perf_counter()
+    reference_queries = normalized(reference_model.embed_documents(queries))
+    reference_seconds = time.perf_counter() - start
+
+    # Vecteurs stockés réutilisés seulement s'ils viennent bien du backend comparé
+    reference_key, candidate_key = embedding_model_key("torch"), embedding_model_key(args.backend)
+    if stored_model == reference_key:
+        reference_chunks = stored_chunks
+    else:
+        print("⚙️ Encodage fp32 de référence des chunks...")
+        reference_chunks = normalized(reference_model.embed_documents(chunks))
+    if stored_model == candidate_key:
+        candidate_chunks = stored_chunks
+    else:
+        print(f"⚙️ Encodage des chunks avec le backend {args.backend}...")
+        candidate_chunks = normalized(candidate_model.embed_documents(chunks))
+    start = time.perf_counter()
+    candidate_queries = normalized(candidate_model.embed_documents(queries))
+    candidate_seconds = time.perf_counter() - start
+
+    # Après ré-ingestion (l'empreinte des chunks inclut le backend) : chunks et requêtes au backend candidat.
+    # "stored_*" : requêtes candidates face aux vecteurs réellement présents dans Chroma aujourd'hui
+    stored_report = parity_report(reference_chunks, stored_chunks, reference_queries, candidate_queries, args.k)
+    report = {
+        "backend": args.backend,
+        "k": args.k,
+        "stored_embedding_model": stored_model,
+        **parity_report(reference_chunks, candidate_chunks, reference_queries, candidate_queries, args.k),
+        **{f"stored_{name}": value for name, value in stored_report.items() if name not in ("queries", "chunks")},
+        "query_encode_ms_fp32": 1000 * reference_seconds / len(queries),
+        f"query_encode_ms_{args.backend}": 1000 * candidate_seconds / len(queries)
+    }
+    for name, value in report.items():
+        print(f"   {name}: {value:.3f}" if isinstance(value, float) else f"   {name}: {value}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n📄 Rapport écrit dans {args.output}")
+
+    if stored_model != candidate_key:
+        print(f"⚠️ Chroma contient des vecteurs {stored_model or 'de modèle inconnu'} : relancer l'ingestion après le passage à {args.backend}.")
+    if report[f"overlap@{args.k}_mean"] < args.min_overlap:
+        raise SystemExit(f"❌ Recouvrement moyen < {args.min_overlap} : garder EMBEDDING_BACKEND=torch.")
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX/int8 export of the embedding model and retrieval-parity check against fp32.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Export to ONNX and quantize to int8")
+    export.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    export.add_argument("--output", default=settings.EMBEDDING_ONNX_PATH)
+    export.add_argument("--opset", type=int, default=17)
+    export.add_argument("--no-quantize", action="store_true", help="Only write the fp32 model.onnx")
+
+    parity = subparsers.add_parser("parity", help="Compare top-k retrieval of the ONNX model with fp32 on the ingested chunks")
+    parity.add_argument("--backend", choices=["onnx", "onnx-int8"], default="onnx-int8")
+    parity.add_argument("--onnx-path", default=settings.EMBEDDING_ONNX_PATH)
+    parity.add_argument("--k", type=int, default=settings.RETRIEVAL_K)
+    parity.add_argument("--test-cases", default="data/test_cases.json")
+    parity.add_argument("--sample-queries", type=int, default=100, help="Chunk prefixes added as extra queries")
+    parity.add_argument("--max-chunks", type=int, default=5000)
+    parity.add_argument("--min-overlap", type=float, default=0.0, help="Exit non-zero below this mean top-k overlap")
+    parity.add_argument("--output", default="data/embedding_parity.json")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        run_export(args)
+    else:
+        run_parity(args)
+
+if __name__ == "__main__":
+    main()
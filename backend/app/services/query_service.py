@@ -1,56 +1,139 @@
-import mlflow
-from sqlalchemy.orm import Session
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.resources import resources
+from app.db.database import SessionLocal
 from app.rag.pipeline import MedicalPipeline
 from app.db.models.query import Query
+from app.db.search import build_search_query
 from app.db.models.user import User
-from app.core.config import settings
+from app.services.telemetry import mlflow_exporter
+
+# Construit à la demande (warm-up du lifespan ou première requête), jamais à l'import
+PIPELINE_RESOURCE = "pipeline"
+resources.register(PIPELINE_RESOURCE, MedicalPipeline)
 
 class QueryService:
     def __init__(self):
-        self.pipeline = MedicalPipeline()
-        
-        mlflow.set_tracking_uri(settings.MLFLOW_TRACKING_URI)
-        mlflow.set_experiment("ProtoCare_Clinical_Decision_Support")
-    
-    def create_medical_query(self, db: Session, user: User, query_text: str):
-        with mlflow.start_run(run_name=f"Dr_{user.username}_Query"):
-            self.pipeline.retriever.log_params()
-            self.pipeline.generator.log_params()
-            
-            result = self.pipeline.search(query_text)
-            
-            
-            raw_answer = result["answer"]
-            if isinstance(raw_answer, list) and len(raw_answer) > 0:
-                
-                final_answer_text = raw_answer[0].get('text', str(raw_answer))
+        # Les runs MLflow sont exportés en arrière-plan, hors du chemin de la requête
+        self.telemetry = mlflow_exporter
+        # Sessions ouvertes uniquement autour de l'écriture, jamais pendant l'appel RAG
+        self.session_factory = SessionLocal
+
+    @property
+    def pipeline(self) -> MedicalPipeline:
+        return resources.get(PIPELINE_RESOURCE)
+
+    @pipeline.setter
+    def pipeline(self, pipeline):
+        resources.provide(PIPELINE_RESOURCE, pipeline)
+
+    async def create_medical_query(self, user: User, query_text: str, service: Optional[str] = None):
+        # Attend la fin du warm-up si besoin, sans bloquer la boucle d'événements
+        pipeline = await resources.aget(PIPELINE_RESOURCE)
+        # Le pipeline RAG est entièrement asynchrone : aucun worker du threadpool n'est bloqué
+        result = await pipeline.asearch(query_text, service)
+
+        return await self._persist(user, query_text, result)
+
+    async def stream_medical_query(self, user: User, query_text: str, service: Optional[str] = None):
+        """Relays the pipeline stream, then persists the full answer once generation is complete."""
+        pipeline = await resources.aget(PIPELINE_RESOURCE)
+        async for event, payload in pipeline.astream_search(query_text, service):
+            if event == "result":
+                yield "done", await self._persist(user, query_text, payload)
             else:
-                final_answer_text = str(raw_answer)
-            
-            mlflow.log_param("user_id", user.id)
-            mlflow.log_param("original_query", query_text)
-            mlflow.log_metric("source_chunks_found", len(result["sources"]))
-            
-            
-            new_query = Query(
-                query_text=query_text,
-                response_text=final_answer_text, 
-                user_id=user.id
-            )
+                yield event, payload
+
+    async def _persist(self, user: User, query_text: str, result: dict):
+        final_answer_text = self._answer_text(result["answer"])
+
+        self._log_run(user, query_text, result)
+
+        new_query = await self._save_query(user, query_text, final_answer_text)
+
+        return {
+        "id": new_query.id,
+        "query_text": query_text,
+        "response_text": final_answer_text,
+        "sources": result["sources"],
+        "service": result.get("service"),
+        "created_at": new_query.created_at
+        }
+
+    @staticmethod
+    def _answer_text(raw_answer) -> str:
+        if isinstance(raw_answer, list) and len(raw_answer) > 0:
+            return raw_answer[0].get('text', str(raw_answer))
+        return str(raw_answer)
+
+    def _log_run(self, user: User, query_text: str, result: dict):
+        # Simple mise en file : ne bloque pas et n'échoue pas si MLflow est lent ou indisponible
+        self.telemetry.submit(
+            run_name=f"Dr_{user.username}_Query",
+            params={
+                **self.pipeline.retriever.get_params(),
+                **self.pipeline.generator.get_params(),
+                "user_id": user.id,
+                "original_query": query_text,
+                "service_filter": result.get("service") or "none"
+            },
+            metrics={"source_chunks_found": len(result["sources"])}
+        )
+
+    async def _save_query(self, user: User, query_text: str, response_text: str):
+        new_query = Query(
+            query_text=query_text,
+            response_text=response_text,
+            user_id=user.id
+        )
+        async with self.session_factory() as db:
             db.add(new_query)
-            db.commit()
-            db.refresh(new_query)
-    
-            return {
-            "id": new_query.id,
-            "query_text": query_text,           
-            "response_text": final_answer_text, 
-            "sources": result["sources"],
-            "created_at": new_query.created_at
-            }
-  
-    def get_user_query_history(self, db: Session, user_id: int):
-        return db.query(Query).filter(
-            Query.user_id == user_id
-        ).order_by(Query.created_at.desc()).all()
+            await db.commit()
+            await db.refresh(new_query)
+        return new_query
+
+    async def get_user_query_history(self, db: AsyncSession, user_id: int, limit: int = 20, cursor: Optional[str] = None):
+        """One page of history summaries, newest first, plus the cursor of the next page (None at the end)."""
+        # Projection : la réponse complète (response_text) n'est pas lue pour la liste
+        query = select(Query.id, Query.query_text, Query.created_at).where(Query.user_id == user_id)
+        if cursor:
+            created_at, query_id = decode_cursor(cursor)
+            # Pagination par clé (created_at, id) : pas d'OFFSET qui relit les pages précédentes
+            query = query.where(or_(
+                Query.created_at < created_at,
+                and_(Query.created_at == created_at, Query.id < query_id)
+            ))
+        rows = (await db.execute(query.order_by(Query.created_at.desc(), Query.id.desc()).limit(limit + 1))).all()
+
+        items = [{"id": row.id, "query_text": row.query_text, "created_at": row.created_at} for row in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    async def get_user_query(self, db: AsyncSession, user_id: int, query_id: int) -> Optional[Query]:
+        # Filtre sur user_id : un médecin ne peut pas lire l'historique d'un autre
+        return (await db.execute(
+            select(Query).where(Query.id == query_id, Query.user_id == user_id)
+        )).scalar_one_or_none()
+
+    async def search_user_queries(self, db: AsyncSession, user_id: int, terms: str, limit: int = 20, offset: int = 0):
+        """Full-text search over one user's questions and answers, best matches first, with highlighted snippets."""
+        rows = (await db.execute(build_search_query(user_id, terms, limit, offset))).all()
+        items = [dict(row._mapping) for row in rows[:limit]]
+        return {"items": items, "next_offset": offset + limit if len(rows) > limit else None}
+
+def encode_cursor(created_at: datetime, query_id: int) -> str:
+    payload = json.dumps({"created_at": created_at.isoformat(), "id": query_id})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(payload["created_at"]), int(payload["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Curseur invalide : {cursor}") from e
+
 query_service = QueryService()
\ No newline at end of file
@@ -0,0 +1,127 @@
+import queue
+import threading
+import time
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
+from prometheus_client import Counter, Gauge
+from app.core.config import settings
+
+TELEMETRY_QUEUED = Gauge('mlflow_telemetry_queue_size', 'Enregistrements MLflow en attente d\'export')
+TELEMETRY_EXPORTED = Counter('mlflow_telemetry_exported_total', 'Runs MLflow exportés par le worker de télémétrie')
+TELEMETRY_DROPPED = Counter('mlflow_telemetry_dropped_total', 'Runs MLflow abandonnés (file pleine)')
+TELEMETRY_EXPORT_ERRORS = Counter('mlflow_telemetry_export_errors_total', 'Runs MLflow perdus suite à une erreur d\'export')
+
+class MLflowExporter:
+    """Collects per-query params/metrics in a bounded queue and exports them from a background thread.
+
+    Export leaves the request path, but each record still costs three tracking-server calls
+    (create_run, log_batch, set_terminated): MLflow has no API to create several runs at once.
+    """
+
+    def __init__(
+        self,
+        experiment_name: str = "ProtoCare_Clinical_Decision_Support",
+        max_queue_size: int = settings.TELEMETRY_QUEUE_SIZE,
+        batch_size: int = settings.TELEMETRY_BATCH_SIZE,
+        flush_interval: float = settings.TELEMETRY_FLUSH_INTERVAL
+    ):
+        self.experiment_name = experiment_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._client = None
+        self._experiment_id = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="mlflow-exporter", daemon=True)
+                self._thread.start()
+
+    def submit(self, run_name: str, params: dict, metrics: dict):
+        """Never blocks the request: when the queue is full the record is dropped and counted."""
+        self.start()
+        record = {"run_name": run_name, "params": params, "metrics": metrics, "timestamp": int(time.time() * 1000)}
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            TELEMETRY_DROPPED.inc()
+        TELEMETRY_QUEUED.set(self.queue.qsize())
+
+    def shutdown(self, timeout: float = 10.0):
+        """Flushes what is still queued, then stops the worker."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._export(batch)
+
+        # Arrêt propre : on vide la file avant de rendre la main
+        while batch := self._drain():
+            self._export(batch)
+
+    def _next_batch(self):
+        # Réveil du worker : batch_size enregistrements ou flush_interval secondes, selon ce qui arrive en premier.
+        # Les enregistrements sont ensuite exportés un par un (un run MLflow chacun)
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _get_client(self):
+        if self._client is None:
+            client = MlflowClient(tracking_uri=settings.MLFLOW_TRACKING_URI)
+            experiment = client.get_experiment_by_name(self.experiment_name)
+            self._experiment_id = (
+                experiment.experiment_id if experiment else client.create_experiment(self.experiment_name)
+            )
+            self._client = client
+        return self._client
+
+    def _export(self, batch):
+        TELEMETRY_QUEUED.set(self.queue.qsize())
+        exported = 0
+        try:
+            client = self._get_client()
+            for record in batch:
+                timestamp = record["timestamp"]
+                run = client.create_run(self._experiment_id, start_time=timestamp, run_name=record["run_name"])
+                # 3 appels par run : log_batch regroupe les paramètres/métriques d'un même run, pas les runs entre eux
+                client.log_batch(
+                    run.info.run_id,
+                    metrics=[Metric(key, float(value), timestamp, 0) for key, value in record["metrics"].items()],
+                    params=[Param(key, str(value)) for key, value in record["params"].items()]
+                )
+                client.set_terminated(run.info.run_id, end_time=timestamp)
+                TELEMETRY_EXPORTED.inc()
+                exported += 1
+        except Exception as e:
+            # MLflow lent ou indisponible : les requêtes cliniques ne sont jamais impactées
+            print(f"⚠️ [Télémétrie] Export MLflow impossible : {e}")
+            TELEMETRY_EXPORT_ERRORS.inc(len(batch) - exported)
+
+mlflow_exporter = MLflowExporter()
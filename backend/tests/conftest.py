@@ -0,0 +1,12 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+@pytest.fixture
+def session_factory():
+    # Remplace SessionLocal : `async with factory() as db` renvoie la session simulée
+    def build(db):
+        session = MagicMock()
+        session.__aenter__ = AsyncMock(return_value=db)
+        session.__aexit__ = AsyncMock(return_value=False)
+        return MagicMock(return_value=session)
+    return build
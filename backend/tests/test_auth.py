@@ -1,6 +1,10 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
 from fastapi.testclient import TestClient
 from app.main import app
-from app.core.security import get_password_hash, verify_password
+from app.api.endpoints.auth import login_access_token
+from app.core.config import settings
+from app.core.security import get_password_hash, needs_rehash, verify_password
 
 client = TestClient(app)
 
@@ -15,4 +19,25 @@ def test_access_blocked_without_token():
     # Vérifie que l'accès à l'historique est refusé sans authentification
     response = client.get("/chat/history")
     assert response.status_code == 401
-    assert response.json()["detail"] == "Not authenticated"
\ No newline at end of file
+    assert response.json()["detail"] == "Not authenticated"
+
+
+def test_login_rehashes_when_cost_factor_changes(monkeypatch):
+    # Coûts faibles pour garder le test rapide
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    old_hash = get_password_hash("pwd_123")
+    user = MagicMock(username="dr_who", hashed_password=old_hash)
+    db = MagicMock(commit=AsyncMock())
+    db.execute = AsyncMock(return_value=MagicMock(scalar_one_or_none=MagicMock(return_value=user)))
+
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 5)
+    assert needs_rehash(old_hash)
+    form = MagicMock(username="dr_who", password="pwd_123")
+    token = asyncio.run(login_access_token(db=db, form_data=form))
+
+    # Le hash stocké est remplacé par un hash au nouveau coût, toujours valide
+    assert token["token_type"] == "bearer"
+    assert user.hashed_password != old_hash and not needs_rehash(user.hashed_password)
+    assert verify_password("pwd_123", user.hashed_password)
+    # Fin de la lecture, puis enregistrement du nouveau hash
+    assert db.commit.await_count == 2
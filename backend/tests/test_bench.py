@@ -0,0 +1,42 @@
+from app.rag.context import split_prefix
+from app.rag.domains import SERVICE_DOMAINS
+from app.scripts.bench_pipeline import compare_reports, fixture_documents, summarize
+
+def test_summarize_reports_percentiles_and_qps():
+    latencies = [0.1 * i for i in range(1, 11)]
+
+    summary = summarize(latencies, errors=1, elapsed=2.0)
+
+    assert summary["requests"] == 11
+    assert summary["qps"] == 5.0
+    assert round(summary["latency_p50_ms"]) == 550
+    assert summary["latency_p50_ms"] < summary["latency_p95_ms"] < summary["latency_p99_ms"] <= 1000
+
+def test_compare_reports_flags_p95_and_qps_regressions():
+    baseline = {"levels": [{"concurrency": 4, "latency_p95_ms": 1000.0, "qps": 10.0}]}
+    # +10 % de p95 reste dans la tolérance, -50 % de débit non
+    report = {"levels": [
+        {"concurrency": 4, "latency_p95_ms": 1100.0, "qps": 5.0},
+        {"concurrency": 16, "latency_p95_ms": 9000.0, "qps": 1.0}
+    ]}
+
+    regressions = compare_reports(baseline, report, max_regression=0.2)
+
+    assert len(regressions) == 1
+    assert "req/s" in regressions[0]
+
+def test_fixture_documents_are_deterministic_and_unique():
+    docs = fixture_documents(20)
+
+    assert len({doc.page_content for doc in docs}) == 20
+    assert [doc.page_content for doc in docs] == [doc.page_content for doc in fixture_documents(20)]
+
+def test_fixture_documents_follow_the_ingestion_format():
+    docs = fixture_documents(8)
+
+    # Même préfixe que l'ingestion : ContextPacker retrouve service et sujet et les retire du corps
+    service, section, body = split_prefix(docs[0])
+    assert (service, section) == (docs[0].metadata["service"], docs[0].metadata["section"])
+    assert not body.startswith("DOMAINE:")
+    # Chaque chunk porte un domaine canonique, filtrable par le `where` de Chroma
+    assert {doc.metadata["domain"] for doc in docs} <= set(SERVICE_DOMAINS)
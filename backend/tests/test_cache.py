@@ -0,0 +1,37 @@
+from app.rag.cache import AnswerCache
+
+def build_cache(tmp_path):
+    cache = AnswerCache()
+    cache.stamp_path = str(tmp_path / "ingestion.stamp")
+    cache._collection_version = None
+    return cache
+
+def test_exact_and_semantic_hits(tmp_path):
+    cache = build_cache(tmp_path)
+    cache.put("Conduite à tenir : morsure ?", [1.0, 0.0], {"answer": "Protocole morsure"})
+
+    # Accents, ponctuation et casse sont ignorés au niveau exact
+    assert cache.get_exact("conduite a tenir morsure")["answer"] == "Protocole morsure"
+    # Au niveau sémantique, seule une question suffisamment proche est servie
+    assert cache.get_semantic([0.99, 0.05])["answer"] == "Protocole morsure"
+    assert cache.get_semantic([0.0, 1.0]) is None
+
+def test_cache_invalidated_when_collection_rebuilt(tmp_path):
+    cache = build_cache(tmp_path)
+    cache.put("bronchiolite", [1.0, 0.0], {"answer": "A"})
+
+    # L'ingestion touche le fichier témoin : toutes les réponses deviennent obsolètes
+    (tmp_path / "ingestion.stamp").write_text("1")
+    assert cache.get_exact("bronchiolite") is None
+
+def test_lru_eviction(tmp_path):
+    cache = build_cache(tmp_path)
+    cache.max_size = 2
+    cache.put("q1", [1.0, 0.0], {"answer": "1"})
+    cache.put("q2", [0.0, 1.0], {"answer": "2"})
+    cache.get_exact("q1")
+    cache.put("q3", [0.7, 0.7], {"answer": "3"})
+
+    # q2 est la moins récemment utilisée
+    assert cache.get_exact("q2") is None
+    assert cache.get_exact("q1")["answer"] == "1"
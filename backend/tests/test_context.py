@@ -0,0 +1,36 @@
+from langchain_core.documents import Document
+from app.rag.context import ContextPacker, split_prefix
+from app.rag.metrics import estimate_tokens
+
+def make_chunk(section: str, body: str, score: float) -> Document:
+    content = f"DOMAINE: PÉDIATRIE\nSUJET: {section}\n---\n## {section}\n{body}"
+    return Document(page_content=content, metadata={"relevance_score": score})
+
+def test_packer_orders_by_score_and_drops_duplicate_prefixes():
+    docs = [
+        make_chunk("Déshydratation", "Réhydratation orale 50 ml/kg.", 0.2),
+        make_chunk("Fièvre", "Paracétamol 15 mg/kg toutes les 6 heures.", 0.9),
+    ]
+
+    context = ContextPacker(max_tokens=1000).pack("Dose de paracétamol ?", docs)
+
+    # Meilleur score en premier, domaine écrit une seule fois, titre Markdown redondant retiré
+    assert context.index("SUJET: Fièvre") < context.index("SUJET: Déshydratation")
+    assert context.count("DOMAINE: PÉDIATRIE") == 1
+    assert "## Fièvre" not in context
+
+def test_packer_trims_long_chunks_to_relevant_sentences():
+    filler = " ".join(f"Surveillance clinique numéro {i} sans particularité." for i in range(60))
+    docs = [make_chunk("Fièvre", f"{filler} Paracétamol 15 mg/kg toutes les 6 heures.", 0.9)]
+
+    context = ContextPacker(max_tokens=120).pack("Quelle dose de paracétamol ?", docs)
+
+    assert estimate_tokens(context) <= 120
+    assert "Paracétamol 15 mg/kg" in context
+
+def test_split_prefix_keeps_horizontal_rules_in_body():
+    # Un "---" Markdown dans le corps ne doit pas être pris pour la fin du préfixe
+    doc = Document(page_content="DOMAINE: Cardiologie\nSUJET: Choc\n---\n## Choc\nTexte A\n---\nTexte B")
+    service, section, body = split_prefix(doc)
+    assert (service, section) == ("Cardiologie", "Choc")
+    assert body == "Texte A\n---\nTexte B"
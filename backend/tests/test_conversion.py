@@ -0,0 +1,37 @@
+from unittest.mock import MagicMock
+from app.rag import conversion
+
+def stub_converter(monkeypatch):
+    document = MagicMock(num_pages=MagicMock(return_value=3))
+    document.export_to_markdown.return_value = "## Fièvre\nParacétamol 15 mg/kg"
+    converter = MagicMock()
+    converter.return_value.convert.return_value = MagicMock(document=document)
+    monkeypatch.setattr(conversion, "DocumentConverter", converter)
+    return converter
+
+def test_convert_pdf_runs_docling_only_on_miss(tmp_path, monkeypatch):
+    converter = stub_converter(monkeypatch)
+    pdf = tmp_path / "guide.pdf"
+    pdf.write_bytes(b"%PDF-1.4 protocole")
+    cache_dir = str(tmp_path / "cache")
+
+    first = conversion.convert_pdf(str(pdf), cache_dir)
+    second = conversion.convert_pdf(str(pdf), cache_dir)
+
+    # Le deuxième appel est servi par le cache : Docling n'est lancé qu'une fois
+    assert first == second == ("## Fièvre\nParacétamol 15 mg/kg", 3)
+    converter.return_value.convert.assert_called_once()
+
+def test_truncated_meta_is_a_cache_miss(tmp_path, monkeypatch):
+    converter = stub_converter(monkeypatch)
+    pdf = tmp_path / "guide.pdf"
+    pdf.write_bytes(b"%PDF-1.4 protocole")
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    key = conversion.cache_key(str(pdf))
+    (cache_dir / f"{key}.md").write_text("ancien", encoding="utf-8")
+    (cache_dir / f"{key}.meta.json").write_text('{"num_pa', encoding="utf-8")
+
+    # Méta-données tronquées par un crash : on reconvertit au lieu d'échouer
+    assert conversion.convert_pdf(str(pdf), str(cache_dir))[1] == 3
+    converter.return_value.convert.assert_called_once()
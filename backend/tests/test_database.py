@@ -0,0 +1,31 @@
+from prometheus_client import CollectorRegistry
+from sqlalchemy import create_engine, text
+from app.db.database import async_database_url, pool_options
+from app.db.metrics import PoolMetrics, instrument_pool
+
+def test_async_database_url_switches_driver():
+    assert async_database_url("postgresql://u:p@db:5432/cliniq") == "postgresql+asyncpg://u:p@db:5432/cliniq"
+    assert async_database_url("sqlite:////tmp/bench.db") == "sqlite+aiosqlite:////tmp/bench.db"
+    # Les options de pool ne concernent que Postgres
+    assert pool_options("sqlite:///:memory:") == {}
+    assert pool_options("postgresql://u:p@db/cliniq")["pool_pre_ping"] is True
+
+def gauge_value(metrics, state):
+    # Les jauges sont lues à la collecte (set_function sur le pool)
+    return next(s.value for s in metrics.connections.collect()[0].samples if s.labels["state"] == state)
+
+def test_pool_metrics_track_checkouts(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+    # Registre dédié : les métriques globales restent liées au moteur de l'API
+    metrics = PoolMetrics(CollectorRegistry())
+    instrument_pool(engine, metrics)
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        # Connexion empruntée tant que le bloc est ouvert
+        assert gauge_value(metrics, "checked_out") == 1
+
+    samples = metrics.checkout_hold.collect()[0].samples
+    assert next(s.value for s in samples if s.name.endswith("_count")) == 1
+    assert gauge_value(metrics, "checked_out") == 0
+    engine.dispose()
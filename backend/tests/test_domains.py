@@ -0,0 +1,21 @@
+from app.rag.domains import canonical_domain, detect_domain
+from app.rag.ingestion import chunk_markdown
+
+def test_canonical_domain_ignores_case_and_accents():
+    assert canonical_domain("SERVICE DES URGENCES") == "URGENCE"
+    assert canonical_domain("pediatrie") == "PÉDIATRIE"
+    assert canonical_domain("Cardiologie") is None
+
+def test_detect_domain_only_when_unambiguous():
+    assert detect_domain("Quelle dose de paracétamol chez le nourrisson ?") == "PÉDIATRIE"
+    assert detect_domain("Conduite à tenir devant une carie profonde ?") == "DENTAIRE"
+    # Deux domaines possibles : pas de filtre
+    assert detect_domain("Arrêt cardiaque chez l'enfant ?") is None
+    assert detect_domain("Quelle dose de paracétamol ?") is None
+
+def test_chunks_carry_canonical_domain():
+    markdown = "## PÉDIATRIE GÉNÉRALE\nIntro\n\n## Fièvre\nParacétamol 15 mg/kg\n\n## Service DENTAIRE\nAbcès"
+
+    chunks = chunk_markdown(markdown, "guide.pdf")
+
+    assert [chunk.metadata["domain"] for chunk in chunks] == ["PÉDIATRIE", "PÉDIATRIE", "DENTAIRE"]
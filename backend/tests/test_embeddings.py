@@ -0,0 +1,59 @@
+import threading
+from unittest.mock import MagicMock
+import pytest
+from app.core.config import settings
+from app.rag.embeddings import CachedEmbeddings, EmbeddingStore, MicroBatchingEmbeddings, RemoteEmbeddings
+
+def test_cached_embeddings_skip_known_texts():
+    model = MagicMock()
+    model.embed_documents.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+    cached = CachedEmbeddings(model, EmbeddingStore(":memory:"), "bge-m3", normalized=True)
+
+    first = cached.embed_documents(["fièvre", "morsure", "fièvre"])
+    second = cached.embed_documents(["morsure", "fièvre"])
+
+    # Un seul forward pass, sur les textes distincts jamais vus
+    model.embed_documents.assert_called_once_with(["fièvre", "morsure"])
+    assert first == [[6.0, 1.0], [7.0, 1.0], [6.0, 1.0]]
+    assert second == [[7.0, 1.0], [6.0, 1.0]]
+
+def test_cache_key_includes_model_name():
+    store = EmbeddingStore(":memory:")
+    model = MagicMock()
+    model.embed_documents.side_effect = lambda texts: [[0.5] for _ in texts]
+
+    CachedEmbeddings(model, store, "bge-m3", normalized=True).embed_query("bronchiolite")
+    CachedEmbeddings(model, store, "bge-m3-int8", normalized=True).embed_query("bronchiolite")
+
+    assert model.embed_documents.call_count == 2
+
+def test_micro_batcher_merges_concurrent_requests():
+    model = MagicMock()
+    model.embed_documents.side_effect = lambda texts: [[float(len(t))] for t in texts]
+    batcher = MicroBatchingEmbeddings(model, max_batch_size=32, max_wait_ms=200)
+
+    results = {}
+    def encode(text):
+        results[text] = batcher.embed_query(text)
+    threads = [threading.Thread(target=encode, args=(text,)) for text in ["a", "bb", "ccc"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Trois requêtes simultanées -> un seul forward pass, chaque appelant reçoit son vecteur
+    assert model.embed_documents.call_count == 1
+    assert results == {"a": [1.0], "bb": [2.0], "ccc": [3.0]}
+
+def test_remote_embeddings_reject_other_backend(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_BACKEND", "torch")
+    remote = RemoteEmbeddings("http://embeddings:8001")
+    response = MagicMock(json=MagicMock(return_value={"model": f"{settings.EMBEDDING_MODEL}:onnx-int8", "vectors": [[1.0]]}))
+    remote.client = MagicMock(post=MagicMock(return_value=response))
+
+    # Vecteurs int8 servis à une API en fp32 : refusés plutôt que stockés sous la mauvaise clé
+    with pytest.raises(RuntimeError):
+        remote.embed_documents(["fièvre"])
+
+    response.json.return_value = {"model": settings.EMBEDDING_MODEL, "vectors": [[1.0]]}
+    assert remote.embed_documents(["fièvre"]) == [[1.0]]
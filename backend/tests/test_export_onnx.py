@@ -0,0 +1,33 @@
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from app.core.config import settings
+from app.scripts.export_onnx import load_chunks, normalized, parity_report
+
+def test_parity_report_measures_topk_overlap():
+    rng = np.random.default_rng(0)
+    chunks = normalized(rng.normal(size=(50, 16)))
+    queries = normalized(rng.normal(size=(10, 16)))
+
+    identical = parity_report(chunks, chunks, queries, queries, k=5)
+    # Modèle optimisé qui ne classe plus rien comme le fp32 : recouvrement partiel seulement
+    shuffled = parity_report(chunks, chunks[::-1].copy(), queries, queries, k=5)
+
+    assert identical["overlap@5_mean"] == 1.0
+    assert identical["top1_recall@5"] == 1.0
+    assert identical["chunk_cosine_min"] > 0.999
+    assert shuffled["overlap@5_mean"] < 1.0
+
+def test_load_chunks_reports_the_stored_embedding_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CHROMA_PERSIST_DIR", str(tmp_path))
+    store = Chroma(persist_directory=str(tmp_path))
+    store._collection.upsert(
+        ids=["a", "b"], embeddings=[[3.0, 4.0], [0.0, 2.0]], documents=["fièvre", "morsure"],
+        metadatas=[{"embedding_model": "BAAI/bge-m3:onnx-int8"}, {"embedding_model": "BAAI/bge-m3:onnx-int8"}]
+    )
+
+    texts, vectors, stored_model = load_chunks(max_chunks=10)
+
+    # La parité compare les requêtes candidates aux vecteurs réellement stockés, de ce modèle
+    assert stored_model == "BAAI/bge-m3:onnx-int8"
+    assert sorted(texts) == ["fièvre", "morsure"]
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
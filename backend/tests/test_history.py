@@ -0,0 +1,85 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from app.api.endpoints.chat import search_history
+from app.db.database import Base
+from app.db.models.query import Query
+from app.db.models.user import User
+from app.services.query_service import decode_cursor, encode_cursor, query_service
+
+@asynccontextmanager
+async def seeded_db():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        session.add_all([
+            User(id=1, username="a", email="a@cliniq.fr", hashed_password="x"),
+            User(id=2, username="b", email="b@cliniq.fr", hashed_password="x")
+        ])
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        # Deux requêtes partagent le même created_at : l'id départage le curseur
+        for i in range(5):
+            session.add(Query(id=i + 1, query_text=f"q{i}", response_text="r" * 1000, user_id=1, created_at=start + timedelta(minutes=min(i, 3))))
+        session.add(Query(id=10, query_text="autre", response_text="r", user_id=2, created_at=start))
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+def test_cursor_roundtrip():
+    created_at = datetime(2026, 1, 1, 12, 30, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+    with pytest.raises(ValueError):
+        decode_cursor("pas-un-curseur")
+
+def test_history_pages_cover_every_query_once():
+    async def walk():
+        # Parcours complet par pages de 2 : ordre décroissant, sans doublon ni saut
+        seen, cursor = [], None
+        async with seeded_db() as db:
+            while True:
+                page = await query_service.get_user_query_history(db, 1, limit=2, cursor=cursor)
+                seen.extend(item["id"] for item in page["items"])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    return seen, page
+
+    seen, page = asyncio.run(walk())
+    assert seen == [5, 4, 3, 2, 1]
+    # Projection : pas de réponse complète dans les résumés
+    assert "response_text" not in page["items"][0]
+
+def test_history_detail_is_scoped_to_user():
+    async def fetch():
+        async with seeded_db() as db:
+            return await query_service.get_user_query(db, 1, 3), await query_service.get_user_query(db, 1, 10)
+
+    own, other = asyncio.run(fetch())
+    assert own.response_text == "r" * 1000
+    assert other is None
+
+def test_search_query_ranks_before_building_snippets():
+    from sqlalchemy.dialects import postgresql
+    from app.db.search import build_search_query
+
+    sql = str(build_search_query(1, "bronchiolite nourrisson", limit=10).compile(dialect=postgresql.dialect()))
+    assert "websearch_to_tsquery" in sql
+    assert "queries.search_vector @@" in sql
+    # ts_headline n'apparaît qu'en dehors de la sous-requête classée et paginée
+    inner = sql[sql.index("(SELECT"):sql.index(") AS anon_1")]
+    assert "ts_rank_cd" in inner and "LIMIT" in inner
+    assert "ts_headline" not in inner
+
+def test_search_is_unavailable_without_postgres():
+    async def search():
+        async with seeded_db() as db:
+            return await search_history(q="fièvre", limit=20, offset=0, db=db, current_user=User(id=1))
+
+    # SQLite (tests, benchmark) : 501 explicite plutôt qu'une erreur SQL en 500
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(search())
+    assert error.value.status_code == 501
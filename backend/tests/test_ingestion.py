@@ -0,0 +1,61 @@
+from langchain_core.documents import Document
+from app.core.config import settings
+from app.rag.ingestion import assign_chunk_ids, diff_chunks, stale_chunk_ids
+
+def make_chunk(section, content, service="PÉDIATRIE"):
+    return Document(
+        page_content=content,
+        metadata={"source": "/app/data/raw_pdfs/guide_medical.pdf", "service": service, "section": section}
+    )
+
+def test_chunk_ids_are_stable_across_runs():
+    first = assign_chunk_ids([make_chunk("Fièvre", "v1"), make_chunk("Fièvre", "v1 bis")])
+    second = assign_chunk_ids([make_chunk("Fièvre", "v2"), make_chunk("Fièvre", "v2 bis")])
+
+    # L'ID dépend de la source et de la section, pas du contenu
+    assert first == second
+    assert len(set(first)) == 2
+
+def test_diff_only_upserts_changed_sections():
+    old_chunks = [make_chunk("Fièvre", "v1"), make_chunk("Morsure", "v1"), make_chunk("Brûlure", "v1")]
+    old_ids = assign_chunk_ids(old_chunks)
+    existing = {chunk_id: c.metadata["content_hash"] for chunk_id, c in zip(old_ids, old_chunks)}
+
+    new_chunks = [make_chunk("Fièvre", "v1"), make_chunk("Morsure", "v2"), make_chunk("Asthme", "v1")]
+    new_ids = assign_chunk_ids(new_chunks)
+    to_upsert, upsert_ids, counts = diff_chunks(new_chunks, new_ids, existing)
+    removed_ids = stale_chunk_ids({chunk_id: "guide_medical.pdf" for chunk_id in existing}, set(new_ids), set())
+
+    assert [c.metadata["section"] for c in to_upsert] == ["Morsure", "Asthme"]
+    assert counts == {"chunks_added": 1, "chunks_updated": 1, "chunks_unchanged": 1}
+    assert removed_ids == [old_ids[2]]
+
+def test_second_run_is_idempotent():
+    chunks = [make_chunk("Fièvre", "v1"), make_chunk("Morsure", "v1")]
+    ids = assign_chunk_ids(chunks)
+    existing = {chunk_id: c.metadata["content_hash"] for chunk_id, c in zip(ids, chunks)}
+
+    to_upsert, _, counts = diff_chunks(chunks, ids, existing)
+    removed_ids = stale_chunk_ids({chunk_id: "guide_medical.pdf" for chunk_id in existing}, set(ids), set())
+
+    assert to_upsert == [] and removed_ids == []
+    assert counts["chunks_unchanged"] == 2
+
+def test_failed_conversion_keeps_stored_chunks():
+    existing_sources = {"a1": "guide_medical.pdf", "b1": "pediatrie.pdf"}
+
+    # pediatrie.pdf n'a pas pu être converti : ses chunks ne doivent pas être supprimés
+    assert stale_chunk_ids(existing_sources, seen_ids=set(), failed_sources={"pediatrie.pdf"}) == ["a1"]
+
+def test_backend_switch_reembeds_every_chunk(monkeypatch):
+    chunks = [make_chunk("Fièvre", "v1"), make_chunk("Morsure", "v1")]
+    ids = assign_chunk_ids(chunks)
+    existing = {chunk_id: c.metadata["content_hash"] for chunk_id, c in zip(ids, chunks)}
+
+    # Vecteurs fp32 stockés, requêtes encodées en int8 : tous les chunks doivent être ré-encodés
+    monkeypatch.setattr(settings, "EMBEDDING_BACKEND", "onnx-int8")
+    new_chunks = [make_chunk("Fièvre", "v1"), make_chunk("Morsure", "v1")]
+    to_upsert, _, counts = diff_chunks(new_chunks, assign_chunk_ids(new_chunks), existing)
+
+    assert len(to_upsert) == 2 and counts["chunks_updated"] == 2
+    assert to_upsert[0].metadata["embedding_model"].endswith(":onnx-int8")
@@ -0,0 +1,32 @@
+import pytest
+from app.rag.generator import MedicalGenerator
+from app.rag.retriever import QueryExpander
+from app.rag.metrics import RAG_EXTERNAL_ERRORS, RAG_STAGE_LATENCY, track_stage
+
+def _sample(metric, name, **labels):
+    for family in metric.collect():
+        for sample in family.samples:
+            if sample.name == name and all(sample.labels.get(k) == v for k, v in labels.items()):
+                return sample.value
+    return 0.0
+
+def test_track_stage_records_latency_and_errors():
+    labels = {"stage": "test_stage", "model": "fake-model"}
+    count_before = _sample(RAG_STAGE_LATENCY, "rag_stage_latency_seconds_count", **labels)
+    errors_before = _sample(RAG_EXTERNAL_ERRORS, "rag_external_call_errors_total", **labels)
+
+    with track_stage("test_stage", "fake-model"):
+        pass
+    # Une étape en échec est chronométrée ET comptée comme erreur
+    with pytest.raises(RuntimeError):
+        with track_stage("test_stage", "fake-model"):
+            raise RuntimeError("Groq indisponible")
+
+    assert _sample(RAG_STAGE_LATENCY, "rag_stage_latency_seconds_count", **labels) == count_before + 2
+    assert _sample(RAG_EXTERNAL_ERRORS, "rag_external_call_errors_total", **labels) == errors_before + 1
+
+def test_llm_metrics_are_labelled_with_the_called_model():
+    # Les chaînes appellent Groq : les dashboards ne doivent pas accuser les modèles Gemini des settings
+    generator = MedicalGenerator()
+    assert generator.model_name == generator.llm.model_name == "llama-3.3-70b-versatile"
+    assert QueryExpander().model_name == "llama-3.1-8b-instant"
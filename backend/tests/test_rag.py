@@ -1,10 +1,13 @@
+import asyncio
 import pytest
-from unittest.mock import MagicMock
-from app.services.query_service import query_service
+from unittest.mock import AsyncMock, MagicMock
+from app.core.resources import resources
+from app.services.query_service import PIPELINE_RESOURCE, query_service
 
-def test_medical_query_processing():
+def test_medical_query_processing(monkeypatch, session_factory):
     # 1. SETUP : Simulation de la DB et de l'User
-    mock_db = MagicMock()
+    mock_db = MagicMock(commit=AsyncMock(), refresh=AsyncMock())
+    monkeypatch.setattr(query_service, "session_factory", session_factory(mock_db))
     mock_user = MagicMock(id=1, username="Dr_Kaoutar")
     
     # Simulation du résultat brut de ton pipeline
@@ -12,15 +15,36 @@ def test_medical_query_processing():
         "answer": [{"text": "Le protocole recommandé est l'usage de X."}],
         "sources": ["guide_clinique_2026.pdf"]
     }
-    # On mocke uniquement la méthode search du pipeline
-    query_service.pipeline.search = MagicMock(return_value=mock_pipeline_result)
+    # Pipeline simulé installé dans le registre (retiré après le test) : BGE-M3 et Chroma ne sont jamais chargés
+    monkeypatch.setitem(resources._instances, PIPELINE_RESOURCE, MagicMock(asearch=AsyncMock(return_value=mock_pipeline_result)))
 
     # 2. EXECUTION
-    result = query_service.create_medical_query(mock_db, mock_user, "Quel est le protocole ?")
+    result = asyncio.run(query_service.create_medical_query(mock_user, "Quel est le protocole ?"))
 
     # 3. ASSERTS : Preuves de bon fonctionnement
     # Vérifie que le texte est extrait correctement de la liste
     assert result["response_text"] == "Le protocole recommandé est l'usage de X."
     # Vérifie que la DB enregistre bien l'action
     mock_db.add.assert_called_once()
-    mock_db.commit.assert_called_once()
\ No newline at end of file
+    mock_db.commit.assert_awaited_once()
+
+def test_medical_query_streaming(monkeypatch, session_factory):
+    mock_db = MagicMock(commit=AsyncMock(), refresh=AsyncMock())
+    monkeypatch.setattr(query_service, "session_factory", session_factory(mock_db))
+    mock_user = MagicMock(id=1, username="Dr_Kaoutar")
+
+    async def fake_stream(query_text, service=None):
+        yield "sources", [{"section": "Fièvre"}]
+        yield "token", "Paracétamol "
+        yield "token", "15 mg/kg."
+        yield "result", {"answer": "Paracétamol 15 mg/kg.", "sources": [{"section": "Fièvre"}]}
+    monkeypatch.setitem(resources._instances, PIPELINE_RESOURCE, MagicMock(astream_search=fake_stream))
+
+    async def collect():
+        return [event async for event in query_service.stream_medical_query(mock_user, "Fièvre ?")]
+    events = asyncio.run(collect())
+
+    # Les sources précèdent les tokens ; la réponse complète est persistée à la fin du flux
+    assert [name for name, _ in events] == ["sources", "token", "token", "done"]
+    assert events[-1][1]["response_text"] == "Paracétamol 15 mg/kg."
+    mock_db.commit.assert_awaited_once()
@@ -0,0 +1,101 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from app.core.rate_limit import RateLimiter, TokenBucket, call_with_backoff
+from app.scripts.eval_rag import EvaluationRunner, PipelineOutputCache
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(capacity=10, rate=5)
+    now = bucket.updated
+
+    bucket.take(10)
+
+    # Bucket vide : 5 unités demandées à 5 unités/s -> 1 seconde d'attente
+    assert bucket.wait_time(5, now) == pytest.approx(1.0)
+    assert bucket.wait_time(5, now + 1.0) == pytest.approx(0.0)
+
+def test_backoff_retries_429_then_succeeds():
+    limiter = RateLimiter(rpm=600, tpm=100000)
+    calls = []
+
+    async def flaky_call():
+        calls.append(1)
+        if len(calls) < 3:
+            raise FakeRateLimitError("Error code: 429 - rate_limit_exceeded")
+        return "ok"
+
+    result = asyncio.run(call_with_backoff(flaky_call, limiter=limiter, tokens=100, base_delay=0.01))
+
+    assert result == "ok"
+    assert len(calls) == 3
+
+def test_backoff_does_not_retry_other_errors():
+    calls = []
+
+    async def broken_call():
+        calls.append(1)
+        raise ValueError("prompt invalide")
+
+    with pytest.raises(ValueError):
+        asyncio.run(call_with_backoff(broken_call, base_delay=0.01))
+    assert len(calls) == 1
+
+def fake_pipeline():
+    # Pipeline simulé : expansion active, prompts de 100 tokens estimés (400 caractères)
+    pipeline = MagicMock()
+    pipeline.resolve_domain = MagicMock(return_value=None)
+    pipeline.retriever.expansion_enabled = True
+    pipeline.retriever.expander.prompt.format = MagicMock(return_value="x" * 400)
+    pipeline.retriever.aget_relevant_documents = AsyncMock(return_value=[MagicMock(metadata={"source": "protocole.pdf"})])
+    pipeline.generator.prompt.format = MagicMock(return_value="x" * 400)
+    pipeline.generator.agenerate = AsyncMock(return_value="Réponse")
+    return pipeline
+
+def test_expansion_uses_the_judge_limiter_and_generation_its_own(tmp_path):
+    limiter = MagicMock(acquire=AsyncMock())
+    generation_limiter = MagicMock(acquire=AsyncMock())
+    cache = PipelineOutputCache(str(tmp_path / "outputs.json"), {})
+    runner = EvaluationRunner(fake_pipeline(), MagicMock(limiter=limiter), cache, 1, "test", generation_limiter=generation_limiter)
+
+    output = asyncio.run(runner.pipeline_output("Fièvre ?"))
+
+    # L'expansion passe par le quota Groq du juge : prompt estimé + reformulations
+    limiter.acquire.assert_awaited_once_with(100 + 128)
+    # La génération passe par le quota du 70b : prompt estimé + réponse clinique
+    generation_limiter.acquire.assert_awaited_once_with(100 + 1024)
+    assert output["actual_output"] == "Réponse"
+
+def test_generation_429_pauses_only_the_generation_limiter(tmp_path, monkeypatch):
+    monkeypatch.setattr(asyncio, "sleep", AsyncMock())
+    limiter = MagicMock(acquire=AsyncMock())
+    generation_limiter = MagicMock(acquire=AsyncMock())
+    pipeline = fake_pipeline()
+    pipeline.generator.agenerate = AsyncMock(side_effect=[FakeRateLimitError("Error code: 429"), "Réponse"])
+    cache = PipelineOutputCache(str(tmp_path / "outputs.json"), {})
+    runner = EvaluationRunner(pipeline, MagicMock(limiter=limiter), cache, 1, "test", generation_limiter=generation_limiter)
+
+    asyncio.run(runner.pipeline_output("Fièvre ?"))
+
+    # Seule la génération est rejouée : le quota du juge n'est ni mis en pause ni consommé deux fois
+    generation_limiter.pause.assert_called_once()
+    limiter.pause.assert_not_called()
+    assert pipeline.retriever.aget_relevant_documents.await_count == 1
+
+def test_log_case_skips_metrics_without_score(tmp_path):
+    cache = PipelineOutputCache(str(tmp_path / "outputs.json"), {})
+    runner = EvaluationRunner(fake_pipeline(), MagicMock(limiter=None), cache, 1, "test")
+    runner.client = MagicMock()
+    metrics = {
+        "faithfulness": MagicMock(score=0.9, reason="ok"),
+        "answer_relevance": MagicMock(score=None, reason=None)
+    }
+
+    runner.log_case(0, {"question": "Fièvre ?", "expected_output": "Paracétamol"}, {"actual_output": "Réponse", "retrieval_context": []}, metrics)
+
+    # Le score manquant n'interrompt pas l'audit : seules les métriques notées sont loggées
+    logged = runner.client.log_batch.call_args.kwargs["metrics"]
+    assert [(metric.key, metric.value) for metric in logged] == [("faithfulness", 0.9)]
+    runner.client.set_terminated.assert_called_once()
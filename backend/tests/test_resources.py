@@ -0,0 +1,33 @@
+import asyncio
+from fastapi.testclient import TestClient
+from app.api.endpoints import health
+from app.core.resources import ResourceRegistry
+from app.main import app
+
+def test_registry_builds_each_resource_once():
+    registry = ResourceRegistry()
+    calls = []
+    registry.register("model", lambda: calls.append(1) or object())
+
+    async def concurrent_gets():
+        return await asyncio.gather(*[registry.aget("model") for _ in range(5)])
+    instances = asyncio.run(concurrent_gets())
+
+    # Cinq requêtes simultanées pendant le chargement : un seul chargement du modèle
+    assert len(calls) == 1
+    assert all(instance is instances[0] for instance in instances)
+
+def test_readiness_reports_503_until_warm_up_completes(monkeypatch):
+    registry = ResourceRegistry()
+    registry.register("pipeline", object)
+    monkeypatch.setattr(health, "resources", registry)
+    client = TestClient(app)
+
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["resources"] == {"pipeline": "pending"}
+
+    asyncio.run(registry.warm_up())
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+from unittest.mock import AsyncMock, MagicMock
+from langchain_core.documents import Document
+from app.rag.retriever import BaseRetriever, MedicalRetriever
+from app.rag.reranker import CrossEncoderReranker
+from app.rag.lexical import BM25Index, reciprocal_rank_fusion
+
+def build_retriever(expansion_delay: float):
+    # On construit le retriever sans charger BGE-M3 ni les clients Groq/Cohere
+    retriever = object.__new__(MedicalRetriever)
+    retriever.speculative = True
+    retriever.expansion_timeout = 0.05
+
+    async def slow_expand(query):
+        await asyncio.sleep(expansion_delay)
+        return [query, "reformulation"]
+
+    retriever.expander = MagicMock(aexpand=slow_expand)
+    retriever.vector_search = MagicMock(deduplicate=BaseRetriever.deduplicate)
+    retriever.vector_search.aretrieve_candidates = AsyncMock(
+        side_effect=lambda queries, query_vector=None, where=None: [Document(page_content=q) for q in queries]
+    )
+    return retriever
+
+def test_speculative_retrieval_merges_expanded_variants():
+    retriever = build_retriever(expansion_delay=0)
+
+    docs = asyncio.run(retriever.aspeculative_candidates("fièvre"))
+
+    # La question originale est cherchée seule, puis les variations à leur arrivée
+    assert [doc.page_content for doc in docs] == ["fièvre", "reformulation"]
+    assert retriever.vector_search.aretrieve_candidates.call_count == 2
+
+def test_speculative_retrieval_falls_back_on_expansion_timeout():
+    retriever = build_retriever(expansion_delay=1)
+
+    docs = asyncio.run(retriever.aspeculative_candidates("fièvre"))
+
+    # L'expansion trop lente est abandonnée : seuls les candidats de la question originale restent
+    assert [doc.page_content for doc in docs] == ["fièvre"]
+    retriever.vector_search.aretrieve_candidates.assert_called_once_with(["fièvre"], None, None)
+
+def test_local_reranker_scores_all_pairs_in_one_batch():
+    model = MagicMock()
+    model.predict.side_effect = lambda pairs, **kwargs: [len(doc) for _, doc in pairs]
+    reranker = CrossEncoderReranker(model_name="local", top_n=2, model=model)
+
+    docs = reranker.compress_documents([Document("a"), Document("abc"), Document("ab")], "fièvre")
+
+    # Un seul appel au cross-encoder pour tous les candidats, triés par score
+    model.predict.assert_called_once()
+    assert [doc.page_content for doc in docs] == ["abc", "ab"]
+    assert docs[0].metadata["relevance_score"] == 3.0
+
+def test_bm25_finds_exact_drug_names(tmp_path):
+    docs = [
+        Document("DOMAINE: PÉDIATRIE\nFièvre : paracétamol 15 mg/kg toutes les 6h"),
+        Document("DOMAINE: URGENCE\nAnaphylaxie : adrénaline IM 0,01 mg/kg"),
+        Document("DOMAINE: DENTAIRE\nAbcès : amoxicilline 1g x3/jour"),
+    ]
+    path = str(tmp_path / "bm25_index.json")
+    BM25Index(docs).save(path)
+
+    # L'index persisté est rechargé à l'identique
+    results = BM25Index.load(path).search("Dose d'adrenaline ?", k=1)
+    assert results[0].page_content == docs[1].page_content
+
+def test_reciprocal_rank_fusion_favours_documents_ranked_by_both():
+    a, b, c = Document("a"), Document("b"), Document("c")
+
+    fused = reciprocal_rank_fusion([[a, b], [b, c]])
+
+    assert [doc.page_content for doc in fused] == ["b", "a", "c"]
+
+def test_bm25_applies_metadata_filter():
+    docs = [
+        Document("Fièvre : paracétamol 15 mg/kg", metadata={"domain": "PÉDIATRIE"}),
+        Document("Fièvre post-opératoire : paracétamol 1 g", metadata={"domain": "URGENCE"}),
+    ]
+    index = BM25Index(docs)
+
+    results = index.search("fièvre paracétamol", k=5, where={"domain": "URGENCE"})
+
+    assert [doc.metadata["domain"] for doc in results] == ["URGENCE"]
+
+def test_filtered_retrieval_falls_back_when_domain_is_empty():
+    retriever = build_retriever(expansion_delay=0)
+    retriever.expansion_enabled = False
+    retriever.rerank_model = "local"
+    retriever.top_n = 3
+    retriever.reranker = MagicMock(acompress_documents=AsyncMock(side_effect=lambda documents, query: documents))
+    # Collection ingérée avant la métadonnée "domain" : le filtre ne renvoie rien
+    retriever.vector_search.aretrieve_candidates = AsyncMock(
+        side_effect=lambda queries, query_vector=None, where=None: [] if where else [Document(page_content="fièvre")]
+    )
+
+    docs = asyncio.run(retriever.aget_relevant_documents("fièvre", where={"domain": "PÉDIATRIE"}))
+
+    assert [doc.page_content for doc in docs] == ["fièvre"]
+    assert retriever.vector_search.aretrieve_candidates.call_count == 2
+
+def test_hybrid_search_runs_bm25_off_the_event_loop():
+    retriever = object.__new__(BaseRetriever)
+    retriever.k = 2
+    retriever.hybrid = True
+    retriever.embedding_model = "fake"
+    retriever.aembed_queries = AsyncMock(return_value=[[1.0]])
+    retriever.asearch_by_vectors = AsyncMock(return_value=[[Document(page_content="dense")]])
+    threads = []
+
+    def search(query, k, where):
+        threads.append(threading.current_thread())
+        return [Document(page_content="lexical")]
+    retriever.lexical_index = MagicMock(return_value=MagicMock(search=search))
+
+    docs = asyncio.run(retriever.aretrieve_candidates(["amoxicilline"]))
+
+    # Le scoring BM25 ne bloque pas la boucle : il tourne dans un thread du pool
+    assert threads and threading.main_thread() not in threads
+    assert {doc.page_content for doc in docs} == {"dense", "lexical"}
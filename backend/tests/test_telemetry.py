@@ -0,0 +1,27 @@
+from unittest.mock import MagicMock
+from app.services.telemetry import MLflowExporter, TELEMETRY_DROPPED
+
+def test_shutdown_flushes_queued_runs_with_log_batch():
+    exporter = MLflowExporter(max_queue_size=10, batch_size=5, flush_interval=60)
+    exporter._client = MagicMock()
+    exporter._experiment_id = "1"
+
+    for i in range(3):
+        exporter.submit(f"Dr_Test_{i}", params={"user_id": i}, metrics={"source_chunks_found": 3})
+    exporter.shutdown()
+
+    # Un run (et un log_batch) par enregistrement, exporté par le worker et non par la requête
+    assert exporter._client.log_batch.call_count == 3
+    assert exporter.queue.empty()
+
+def test_full_queue_drops_instead_of_blocking():
+    exporter = MLflowExporter(max_queue_size=1, batch_size=1, flush_interval=60)
+    # Pas de worker : la file se remplit
+    exporter.start = MagicMock()
+    dropped_before = TELEMETRY_DROPPED._value.get()
+
+    exporter.submit("Dr_A", params={}, metrics={})
+    exporter.submit("Dr_B", params={}, metrics={})
+
+    assert exporter.queue.qsize() == 1
+    assert TELEMETRY_DROPPED._value.get() == dropped_before + 1
@@ -0,0 +1,51 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+from app.api import deps
+from app.core.security import create_access_token
+from app.core.user_cache import UserCache, invalidate_cached_user, user_cache
+
+def fake_user_db(user):
+    # Session simulée dont le SELECT renvoie `user`
+    return MagicMock(execute=AsyncMock(return_value=MagicMock(scalar_one_or_none=MagicMock(return_value=user))))
+
+def test_get_current_user_hits_db_once(monkeypatch, session_factory):
+    user = MagicMock(id=1, username="dr_house")
+    db = fake_user_db(user)
+    monkeypatch.setattr(deps, "SessionLocal", session_factory(db))
+    user_cache.clear()
+    token = create_access_token({"sub": "dr_house"})
+
+    async def resolve_twice():
+        return [await deps.get_current_user(token) for _ in range(2)]
+    first, second = asyncio.run(resolve_twice())
+
+    # Le deuxième appel est servi par le cache : un seul SELECT
+    assert first is second is user
+    db.execute.assert_awaited_once()
+    user_cache.clear()
+
+def test_user_cache_ttl_and_lru(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.core.user_cache.time.monotonic", lambda: now[0])
+    cache = UserCache(ttl=60, max_size=2)
+    for name in ("a", "b", "c"):
+        cache.put(MagicMock(username=name))
+
+    # "a" est évincé par la borne de taille, puis tout expire après le TTL
+    assert cache.get("a") is None
+    assert cache.get("c").username == "c"
+    now[0] += 61
+    assert cache.get("c") is None
+
+def test_user_update_invalidates_entry(monkeypatch):
+    user = MagicMock(username="dr_new")
+    user_cache.put(user)
+    user_cache.put(MagicMock(username="dr_old"))
+    # Renommage dr_old -> dr_new : les deux sujets sont purgés
+    history = MagicMock()
+    history.attrs.username.history.deleted = ["dr_old"]
+    monkeypatch.setattr("app.core.user_cache.inspect", lambda target: history)
+
+    invalidate_cached_user(None, None, user)
+    assert user_cache.get("dr_new") is None
+    assert user_cache.get("dr_old") is None
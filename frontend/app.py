@@ -9,6 +9,11 @@ if "access_token" not in st.session_state:
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
 
+def clear_history():
+    # L'historique chargé par le Dashboard appartient au médecin connecté
+    for key in [key for key in st.session_state if key.startswith("history_")]:
+        del st.session_state[key]
+
 def auth_page():
     st.title("CliniQ - Portail Médical")
     tab1, tab2 = st.tabs(["Connexion", "Inscription"])
@@ -28,6 +33,7 @@ def auth_page():
                     st.session_state.access_token = token_data["access_token"]
                     st.session_state.authenticated = True
                     st.session_state.user_name = username
+                    clear_history()
                     st.success("Authentification réussie !")
                     st.rerun()
                 else:
@@ -54,7 +60,9 @@ else:
     st.sidebar.success(f"Dr. {st.session_state.user_name}")
     st.title("Tableau de Bord CliniQ")
     st.info("Utilisez la barre latérale pour accéder aux services.")
+    st.session_state.active_page = "home"
     if st.sidebar.button("Déconnexion"):
         st.session_state.access_token = None
         st.session_state.authenticated = False
+        clear_history()
         st.rerun()
\ No newline at end of file
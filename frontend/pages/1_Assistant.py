@@ -1,3 +1,4 @@
+import json
 import streamlit as st
 import requests
 
@@ -11,54 +12,69 @@ st.title("Support Décisionnel RAG")
 st.markdown("---")
 
 query_text = st.text_area("Question clinique :", placeholder="Ex: Quelle est la procédure pour une transplantation hépatique ?")
+# Restreint la recherche aux protocoles d'un service (filtre appliqué côté Chroma)
+service = st.selectbox("Service :", ["Tous les services", "PÉDIATRIE", "DENTAIRE", "MÉDECINE", "URGENCE"])
+
+def read_sse(response):
+    # Découpe le flux Server-Sent Events en (event, data)
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
+
+def stream_tokens(events, state):
+    # Les sources arrivent avant la génération ; les tokens sont affichés au fil de l'eau
+    for event, data in events:
+        if event == "sources":
+            state["sources"] = data
+        elif event == "token":
+            yield data
+        elif event == "done":
+            state["done"] = data
+        elif event == "error":
+            state["error"] = data.get("detail")
+
+st.session_state.active_page = "assistant"
 
 if st.button("Analyser et Générer la réponse"):
     if query_text:
-        with st.spinner("Génération en cours..."):
-            try:
-                headers = {"Authorization": f"Bearer {st.session_state.access_token}"}
-                payload = {"query_text": query_text}
-                
-                response = requests.post(
-                    "http://backend:8000/chat/query", 
-                    json=payload, 
-                    headers=headers
-                )
-                
+        try:
+            headers = {"Authorization": f"Bearer {st.session_state.access_token}"}
+            payload = {"query_text": query_text}
+            if service != "Tous les services":
+                payload["service"] = service
+
+            with requests.post(
+                "http://backend:8000/chat/query/stream",
+                json=payload,
+                headers=headers,
+                stream=True
+            ) as response:
                 if response.status_code == 200:
-                    data = response.json()
-                    
-                    # --- SÉCURITÉ : Recherche de la réponse dans le JSON ---
-                    # Ton backend peut renvoyer 'answer' OU 'response_text'
-                    assistant_answer = data.get("answer") or data.get("response_text")
-                    
-                    if assistant_answer:
-                        st.subheader("Réponse de l'Assistant")
-                        st.success(assistant_answer)
-                    else:
-                        st.error("Le backend n'a pas renvoyé de champ 'answer' ou 'response_text'.")
-                        st.json(data) # Affiche le JSON brut pour débugger devant le formateur
-                    
+                    state = {"sources": [], "done": None, "error": None}
+                    st.subheader("Réponse de l'Assistant")
+                    st.write_stream(stream_tokens(read_sse(response), state))
+
+                    if state["error"]:
+                        st.error(state["error"])
+
                     with st.expander("Détails de confiance & Sources"):
-                        # Vérification des champs de métriques
-                        f_score = data.get('faithfulness_score') or data.get('faithfulness')
-                        st.write(f"**Score de fidélité :** {f_score if f_score is not None else 'N/A'}")
-                        
                         st.write("**Documents sources :**")
-                        sources = data.get("source_documents") or data.get("sources", [])
-                        if sources:
-                            for doc in sources:
+                        if state["sources"]:
+                            for doc in state["sources"]:
                                 st.write(f"- {doc}")
                         else:
                             st.write("Aucune source listée.")
-                
+
                 elif response.status_code == 401:
                     st.error("Session expirée. Veuillez vous reconnecter.")
                 else:
                     st.error(f"Erreur Backend {response.status_code}: {response.text}")
-                    
-            except Exception as e:
-                # Utilisation de repr(e) pour voir l'erreur réelle sans crash de clé
-                st.error(f"Erreur de communication : {repr(e)}")
+
+        except Exception as e:
+            # Utilisation de repr(e) pour voir l'erreur réelle sans crash de clé
+            st.error(f"Erreur de communication : {repr(e)}")
     else:
         st.warning("Veuillez saisir une question.")
\ No newline at end of file
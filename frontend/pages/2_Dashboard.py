@@ -12,26 +12,92 @@ st.title("Historique des Interactions")
 # On prépare le header avec le Token
 headers = {"Authorization": f"Bearer {st.session_state.access_token}"}
 
-try:
-    response = requests.get("http://backend:8000/chat/history", headers=headers)
+def reset_history():
+    for key in [key for key in st.session_state if key.startswith("history_")]:
+        del st.session_state[key]
+
+# Première page rechargée à chaque arrivée sur le Dashboard : les questions posées entre-temps y figurent
+if st.session_state.get("active_page") != "dashboard":
+    reset_history()
+st.session_state.active_page = "dashboard"
+if st.button("Rafraîchir"):
+    reset_history()
+
+# Pages déjà chargées (résumés) et réponses complètes déjà demandées
+st.session_state.setdefault("history_items", [])
+st.session_state.setdefault("history_cursor", None)
+st.session_state.setdefault("history_loaded", False)
+st.session_state.setdefault("history_details", {})
+
+def load_page():
+    params = {"limit": 20}
+    if st.session_state.history_cursor:
+        params["cursor"] = st.session_state.history_cursor
+    response = requests.get("http://backend:8000/chat/history", headers=headers, params=params)
+    if response.status_code != 200:
+        st.error(f"Erreur {response.status_code} : {response.text}")
+        return
+    page = response.json()
+    st.session_state.history_items.extend(page["items"])
+    st.session_state.history_cursor = page["next_cursor"]
+    st.session_state.history_loaded = True
+
+def load_detail(query_id):
+    # La réponse complète n'est lue qu'à la demande
+    response = requests.get(f"http://backend:8000/chat/history/{query_id}", headers=headers)
     if response.status_code == 200:
-        history = response.json()
-        if not history:
-            st.write("Aucune donnée enregistrée.")
-        for item in reversed(history):
-            # Debug temporaire pour voir les vrais noms des clés
-            # st.write(item.keys()) 
-            
-            # On récupère la question (vérifie si c'est 'query_text' ou 'query')
-            q = item.get('query_text') or item.get('query') or "Question inconnue"
-            
-            # On récupère la réponse (vérifie si c'est 'answer' ou 'response_text')
-            a = item.get('answer') or item.get('response_text') or "Pas de réponse"
-            
-            with st.expander(f"Question : {q}"):
-                st.write(f"**Réponse :** {a}")
-                st.caption(f"Fidélité : {item.get('faithfulness_score', 'N/A')}")
+        st.session_state.history_details[query_id] = response.json()
     else:
         st.error(f"Erreur {response.status_code} : {response.text}")
+
+def search(terms):
+    response = requests.get(
+        "http://backend:8000/chat/history/search", headers=headers, params={"q": terms, "limit": 20}
+    )
+    if response.status_code != 200:
+        st.error(f"Erreur {response.status_code} : {response.text}")
+        return
+    hits = response.json()["items"]
+    if not hits:
+        st.write("Aucun résultat.")
+    for hit in hits:
+        # Extraits surlignés par Postgres (termes en gras)
+        with st.expander(f"Question : {hit['query_text']}"):
+            st.caption(hit["created_at"])
+            st.markdown(hit["query_snippet"])
+            st.markdown(f"**Réponse :** {hit['response_snippet']}")
+            if st.button("Afficher la réponse complète", key=f"search_detail_{hit['id']}"):
+                load_detail(hit["id"])
+            detail = st.session_state.history_details.get(hit["id"])
+            if detail:
+                st.write(detail["response_text"])
+
+def show_history():
+    if not st.session_state.history_loaded:
+        load_page()
+
+    if not st.session_state.history_items:
+        st.write("Aucune donnée enregistrée.")
+    for item in st.session_state.history_items:
+        with st.expander(f"Question : {item['query_text']}"):
+            st.caption(item["created_at"])
+            detail = st.session_state.history_details.get(item["id"])
+            if detail:
+                st.write(f"**Réponse :** {detail['response_text']}")
+            elif st.button("Afficher la réponse", key=f"detail_{item['id']}"):
+                load_detail(item["id"])
+                st.rerun()
+
+    if st.session_state.history_cursor and st.button("Charger plus"):
+        load_page()
+        st.rerun()
+
+terms = st.text_input("Rechercher dans l'historique", placeholder="ex. bronchiolite nourrisson")
+
+try:
+    if terms.strip():
+        search(terms.strip())
+    else:
+        show_history()
 except Exception as e:
-    st.error(f"Erreur de connexion : {e}")
\ No newline at end of file
+    st.error(f"Erreur de connexion : {e}")